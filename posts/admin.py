@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from . import search
 from .models import Comment, Group, Post
 
 
@@ -9,6 +10,11 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search.enabled() or not search.match_expression(search_term):
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(id__in=search.matching_ids(search_term)), False
+
 
 admin.site.register(Post, PostAdmin)
 
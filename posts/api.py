@@ -0,0 +1,158 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.http import urlencode
+from django.views.decorators.http import (condition, require_POST,
+                                          require_safe)
+
+from . import cache, follows, groups
+from .models import Post
+from .paginators import KeysetPaginator
+
+User = get_user_model()
+
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+API_MAX_FOLLOWS = 100
+
+
+def serialize_post(post):
+    return {
+        'id': post.id,
+        'author': post.author.username,
+        'group': post.group.slug if post.group_id else None,
+        'text': post.text,
+        'pub_date': post.pub_date,
+        'image': post.image.url if post.image else None,
+        'comments': post.comment_count,
+        'url': post.get_absolute_url(),
+    }
+
+
+def page_size(request):
+    try:
+        size = int(request.GET.get('limit', API_PAGE_SIZE))
+    except ValueError:
+        size = API_PAGE_SIZE
+    return max(1, min(size, API_MAX_PAGE_SIZE))
+
+
+def feed_view(get_feed):
+    """JSON view over the feed queryset returned by ``get_feed(**kwargs)``.
+
+    The feed is addressed by keyset cursors (``?after=``, ``?before=``).
+    ``ETag`` and ``Last-Modified`` come from the versions of the posts
+    on the requested page (and of their groups), so edits, new comments
+    and deletions all change them, while a client that already has the
+    page gets 304 after one narrow query, without serializing posts.
+    """
+    def feed(request, **kwargs):
+        if not hasattr(request, 'api_feed'):
+            request.api_feed = get_feed(**kwargs)
+        return request.api_feed
+
+    def page_versions(request, **kwargs):
+        if not hasattr(request, 'api_page_versions'):
+            paginator = KeysetPaginator(
+                feed(request, **kwargs).select_related(None).select_related(
+                    'group').only('id', 'pub_date', 'updated', 'version',
+                                  'group', 'group__updated', 'group__version'),
+                page_size(request))
+            request.api_page_versions = list(paginator.get_page(
+                after=request.GET.get('after'),
+                before=request.GET.get('before')))
+        return request.api_page_versions
+
+    def etag(request, **kwargs):
+        posts = page_versions(request, **kwargs)
+        objects = [obj for post in posts for obj in (post, post.group)]
+        return cache.etag(objects, request.get_full_path())
+
+    def last_modified(request, **kwargs):
+        return cache.last_modified(page_versions(request, **kwargs))
+
+    @require_safe
+    @condition(etag_func=etag, last_modified_func=last_modified)
+    def view(request, **kwargs):
+        paginator = KeysetPaginator(feed(request, **kwargs),
+                                    page_size(request))
+        page = paginator.get_page(after=request.GET.get('after'),
+                                  before=request.GET.get('before'))
+        links = {'next': ('after', page.next_cursor),
+                 'previous': ('before', page.previous_cursor)}
+        data = {'results': [serialize_post(post) for post in page]}
+        for name, (param, cursor) in links.items():
+            data[name] = None
+            if cursor:
+                data[name] = '%s?%s' % (request.path, urlencode(
+                    {param: cursor, 'limit': paginator.per_page}))
+        return JsonResponse(data, json_dumps_params={
+            'separators': (',', ':'), 'ensure_ascii': False})
+    return view
+
+
+def index_feed():
+    return Post.objects.feed()
+
+
+def group_feed(slug):
+    group = groups.get_group_or_404(slug)
+    return Post.objects.feed().filter(group=group)
+
+
+def profile_feed(username):
+    author = get_object_or_404(User, username=username)
+    return Post.objects.feed().filter(author=author)
+
+
+index = feed_view(index_feed)
+group_posts = feed_view(group_feed)
+profile = feed_view(profile_feed)
+
+
+def requested_authors(request):
+    """Usernames from ``{"authors": [...]}`` or repeated ``author`` fields."""
+    if request.content_type == 'application/json':
+        try:
+            names = json.loads(request.body.decode() or '{}')['authors']
+        except (ValueError, KeyError, TypeError):
+            return None
+    else:
+        names = request.POST.getlist('author')
+    if not isinstance(names, list) or not all(
+            isinstance(name, str) for name in names):
+        return None
+    return names
+
+
+def follows_view(change):
+    """POST view applying ``change(user, author_ids)`` to listed authors.
+
+    Authors are resolved with one query and the follows are changed in
+    one transaction; the answer is a short JSON instead of a redirect
+    to the profile page.
+    """
+    @require_POST
+    def view(request):
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Нужно войти.'}, status=401)
+        names = requested_authors(request)
+        if not names or len(names) > API_MAX_FOLLOWS:
+            return JsonResponse(
+                {'error': 'Нужен список авторов (не больше %s).'
+                          % API_MAX_FOLLOWS}, status=400)
+        authors = dict(User.objects.filter(username__in=names).values_list(
+            'id', 'username'))
+        changed = change(request.user, list(authors))
+        return JsonResponse({
+            'changed': [authors[author_id] for author_id in changed],
+            'missing': sorted(set(names) - set(authors.values())),
+        }, json_dumps_params={'separators': (',', ':'),
+                              'ensure_ascii': False})
+    return view
+
+
+follow = follows_view(follows.follow)
+unfollow = follows_view(follows.unfollow)
@@ -0,0 +1,11 @@
+from django.urls import path
+
+from . import api
+
+urlpatterns = [
+    path('posts/', api.index, name='api_index'),
+    path('group/<slug:slug>/posts/', api.group_posts, name='api_group_posts'),
+    path('users/<str:username>/posts/', api.profile, name='api_profile'),
+    path('follow/', api.follow, name='api_follow'),
+    path('unfollow/', api.unfollow, name='api_unfollow'),
+]
@@ -0,0 +1,182 @@
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import timedelta
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import counters, scores, search, suggestions, timeline
+from .models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+# свой кеш на время прогона: --cold очищает кеш, а синтетические данные
+# не должны попадать в общий кеш сайта (YATUBE_SHARED_CACHE)
+PRIVATE_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    },
+}
+
+
+def private_cache():
+    return override_settings(CACHES=PRIVATE_CACHES)
+
+
+WORDS = ('yatube', 'post', 'день', 'город', 'кот', 'музыка', 'книга',
+         'погода', 'отпуск', 'работа', 'фото', 'друзья', 'кино', 'море')
+
+
+def seed(users=100, groups=10, posts=2000, comments=5000, follows=10,
+         random_seed=0, batch_size=500):
+    """Fill an empty database with a synthetic dataset.
+
+    Rows are inserted with ``bulk_create``; counters, timelines and the
+    search index are then rebuilt the same way the app maintains them.
+    """
+    rnd = random.Random(random_seed)
+    User.objects.bulk_create(
+        [User(id=i, username='bench%s' % i, password='!')
+         for i in range(1, users + 1)], batch_size=batch_size)
+    Group.objects.bulk_create(
+        [Group(id=i, title='Группа %s' % i, slug='group-%s' % i,
+               description='Описание')
+         for i in range(1, groups + 1)], batch_size=batch_size)
+    now = timezone.now()
+    new_posts = [
+        Post(id=i, author_id=rnd.randint(1, users),
+             group_id=rnd.choice([None, rnd.randint(1, groups)]),
+             text=' '.join(rnd.choice(WORDS) for _ in range(20)))
+        for i in range(1, posts + 1)]
+    Post.objects.bulk_create(new_posts, batch_size=batch_size)
+    # auto_now_add перезаписывает дату при вставке - разносим отдельно
+    for post in new_posts:
+        post.pub_date = now - timedelta(minutes=posts - post.id)
+    Post.objects.bulk_update(new_posts, ['pub_date'], batch_size=batch_size)
+    Comment.objects.bulk_create(
+        [Comment(post_id=rnd.randint(1, posts),
+                 author_id=rnd.randint(1, users), text='Комментарий')
+         for _ in range(comments)], batch_size=batch_size)
+    edges = set()
+    for user_id in range(1, users + 1):
+        for author_id in rnd.sample(range(1, users + 1),
+                                    min(follows, users)):
+            if author_id != user_id:
+                edges.add((user_id, author_id))
+    Follow.objects.bulk_create(
+        [Follow(user_id=user_id, author_id=author_id)
+         for user_id, author_id in edges], batch_size=batch_size)
+    counters.reconcile()
+    for user_id, author_id in edges:
+        timeline.backfill(user_id, author_id)
+    search.rebuild()
+    scores.rebuild()
+    suggestions.rebuild()
+
+
+def scenarios():
+    """(name, url, username or None) for every measured view."""
+    post = Post.objects.order_by('-comment_count').select_related(
+        'author').first()
+    group = Group.objects.order_by('id').first()
+    reader = User.objects.order_by('-counters__following').first()
+    author = User.objects.order_by('-counters__posts').first()
+    return [
+        ('index', reverse('index'), None),
+        ('index_page_5', reverse('index') + '?page=5', None),
+        ('group_posts', reverse('group_posts', args=[group.slug]), None),
+        ('profile', reverse('profile', args=[author.username]), None),
+        ('post_view', reverse('post', args=[post.author.username, post.id]),
+         None),
+        ('follow_index', reverse('follow_index'), reader.username),
+        ('search', reverse('search') + '?q=' + WORDS[4], None),
+        ('trending', reverse('trending'), None),
+        ('discussed', reverse('discussed'), None),
+    ]
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    index = (len(ordered) - 1) * q
+    low = int(index)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (index - low)
+
+
+def measure(url, username=None, iterations=50, warmup=5, cold=False):
+    client = Client()
+    if username:
+        client.force_login(User.objects.get(username=username))
+    for _ in range(warmup):
+        client.get(url)
+    timings, queries = [], []
+    for _ in range(iterations):
+        if cold:
+            cache.clear()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - start) * 1000)
+        if response.status_code != 200:
+            raise RuntimeError('%s ответил %s' % (url, response.status_code))
+        queries.append(len(captured))
+    if cold:
+        cache.clear()
+    tracemalloc.start()
+    client.get(url)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'url': url,
+        'iterations': iterations,
+        'p50_ms': round(percentile(timings, 0.5), 3),
+        'p90_ms': round(percentile(timings, 0.9), 3),
+        'p99_ms': round(percentile(timings, 0.99), 3),
+        'mean_ms': round(statistics.mean(timings), 3),
+        'queries': max(queries),
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def run(iterations=50, warmup=5, cold=False, only=None):
+    results = {}
+    for name, url, username in scenarios():
+        if only and name not in only:
+            continue
+        results[name] = measure(url, username, iterations, warmup, cold)
+    return {
+        'meta': {
+            'created': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'cold_cache': cold,
+        },
+        'views': results,
+    }
+
+
+def compare(baseline, current, tolerance=0.2):
+    """Rows of (view, metric, before, after, change, regressed)."""
+    rows = []
+    for name, after in current['views'].items():
+        before = baseline['views'].get(name)
+        if before is None:
+            continue
+        for metric in ('p50_ms', 'p90_ms', 'queries', 'peak_kib'):
+            old, new = before[metric], after[metric]
+            change = (new - old) / old if old else 0.0
+            regressed = change > tolerance if metric != 'queries' \
+                else new > old
+            rows.append((name, metric, old, new, change, regressed))
+    return rows
@@ -0,0 +1,78 @@
+import hashlib
+import uuid
+
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+from django.template.loader import render_to_string
+
+CARD_KEY = 'posts:card:%s'
+CARD_TIMEOUT = 86400
+
+
+def new_version():
+    return uuid.uuid4().hex[:12]
+
+
+def version_key(*objects):
+    """Key part naming the given rows at their current versions.
+
+    Works for any ``Versioned`` model; ``None`` entries (e.g. a post
+    without a group) are skipped. ``updated`` is part of the key so that
+    a row recreated with the same id and version (a restored database,
+    a rolled back test) does not pick up entries of the old one.
+    """
+    return ':'.join('%s.%s.%s.%s' % (obj._meta.label_lower, obj.pk,
+                                     obj.version, obj.updated.timestamp())
+                    for obj in objects if obj is not None)
+
+
+def etag(objects, extra=''):
+    """ETag for a response built from ``objects`` (and ``extra``)."""
+    key = '%s|%s' % (version_key(*objects), extra)
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+def last_modified(objects):
+    return max((obj.updated for obj in objects), default=None)
+
+
+def touch(model, pks, **updates):
+    """Bump the version of rows changed by a queryset ``update()``.
+
+    ``update()`` skips ``save()``, so callers that change rows in bulk
+    pass their own field updates here to be applied in the same query.
+    """
+    return model.objects.filter(pk__in=pks).update(
+        version=F('version') + 1, updated=timezone.now(), **updates)
+
+
+def card_key(post):
+    return CARD_KEY % version_key(post, post.group)
+
+
+def prefetch_cards(posts):
+    """Attach cached card HTML to a page of posts.
+
+    One cache round trip for the whole page instead of one per card;
+    ``card_html`` is None for cards that have to be rendered.
+    """
+    keys = {card_key(post): post for post in posts}
+    found = cache.get_many(keys)
+    for key, post in keys.items():
+        post.card_html = found.get(key)
+
+
+def card_html(post):
+    """HTML of the post card; rendered and cached when not prefetched."""
+    html = getattr(post, 'card_html', None)
+    if html is not None:
+        return html
+    if not hasattr(post, 'card_html'):
+        prefetch_cards([post])
+        if post.card_html is not None:
+            return post.card_html
+    html = render_to_string('include/post_card.html', {'post': post})
+    cache.set(card_key(post), html, CARD_TIMEOUT)
+    post.card_html = html
+    return html
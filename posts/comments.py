@@ -0,0 +1,103 @@
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+
+from . import counters, scores
+from .models import Comment
+
+
+class Batch:
+    def __init__(self):
+        self.items = []
+        self.errors = {}
+        self.closed = False
+        self.done = threading.Event()
+
+
+class CommentBatcher:
+    """Group commit for comments posted at the same time.
+
+    The first request to arrive leads a batch: it waits up to
+    ``COMMENT_BATCH_WAIT`` seconds (or until ``COMMENT_BATCH_SIZE``
+    comments joined), then writes the whole batch in one transaction and
+    wakes the others. Every request returns only after its own comment
+    is committed, so the redirect that follows always shows it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._joined = threading.Condition(self._lock)
+        self._open = None
+
+    def submit(self, comment):
+        size = settings.COMMENT_BATCH_SIZE
+        with self._lock:
+            batch = self._open
+            leader = batch is None or batch.closed
+            if leader:
+                batch = self._open = Batch()
+            batch.items.append(comment)
+            if len(batch.items) >= size:
+                batch.closed = True
+                self._joined.notify_all()
+            if leader:
+                self._joined.wait_for(lambda: batch.closed,
+                                      settings.COMMENT_BATCH_WAIT)
+                batch.closed = True
+                if self._open is batch:
+                    self._open = None
+        if leader:
+            try:
+                self._write(batch)
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+        error = batch.errors.get(id(comment))
+        if error is not None:
+            raise error
+
+    def _write(self, batch):
+        try:
+            insert(batch.items)
+        except DatabaseError:
+            # один плохой комментарий (например, к удалённому посту)
+            # не должен ронять остальные - пишем по одному
+            for comment in batch.items:
+                try:
+                    insert([comment])
+                except Exception as e:
+                    batch.errors[id(comment)] = e
+        except Exception as e:
+            # любая другая ошибка - пакет не записан: ошибку получает
+            # каждый ждущий запрос, а не только ведущий
+            for comment in batch.items:
+                batch.errors[id(comment)] = e
+
+
+def insert(comments):
+    """Insert comments in one transaction, updating post counters.
+
+    ``bulk_create`` skips the model signals, so the comment counters and
+    post scores are changed here: once per post rather than per comment.
+    """
+    with transaction.atomic():
+        Comment.objects.bulk_create(comments)
+        per_post = Counter(comment.post_id for comment in comments)
+        for post_id, n in per_post.items():
+            counters.change_post(post_id, n)
+        scores.comments_added(comments)
+
+
+batcher = CommentBatcher()
+
+
+def add_comment(comment):
+    """Save a new comment, through the batcher when batching is on."""
+    if settings.COMMENT_BATCHING:
+        batcher.submit(comment)
+    else:
+        with transaction.atomic():
+            comment.save()
@@ -0,0 +1,88 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from . import timeline
+from .cache import touch
+from .models import Comment, Follow, Post, UserCounters
+
+User = get_user_model()
+
+
+def get_counters(user):
+    try:
+        return user.counters
+    except UserCounters.DoesNotExist:
+        counters, _ = UserCounters.objects.get_or_create(user=user)
+        return counters
+
+
+def change_user(user_id, **deltas):
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    updated = UserCounters.objects.filter(user_id=user_id).update(**updates)
+    # строки нет только у пользователей, созданных в обход сигналов;
+    # при удалении её не создаём - пользователь может удаляться каскадом
+    if not updated and min(deltas.values()) > 0:
+        UserCounters.objects.get_or_create(user_id=user_id)
+        UserCounters.objects.filter(user_id=user_id).update(**updates)
+
+
+def change_users(user_ids, **deltas):
+    """``change_user`` for several users in one UPDATE."""
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    updated = UserCounters.objects.filter(user_id__in=user_ids).update(
+        **updates)
+    if updated < len(user_ids) and min(deltas.values()) > 0:
+        existing = set(UserCounters.objects.filter(
+            user_id__in=user_ids).values_list('user_id', flat=True))
+        UserCounters.objects.bulk_create(
+            [UserCounters(user_id=user_id, **deltas)
+             for user_id in set(user_ids) - existing],
+            ignore_conflicts=True)
+
+
+def change_post(post_id, delta):
+    # счётчик виден в карточке и в API - это изменение поста
+    touch(Post, [post_id], comment_count=F('comment_count') + delta)
+
+
+def _count(model, field):
+    rows = model.objects.filter(**{field: OuterRef('pk')}).order_by(
+        ).values(field).annotate(total=Count('pk')).values('total')
+    return Coalesce(Subquery(rows), 0)
+
+
+def reconcile(fix=True):
+    """Compare stored counters with the source tables.
+
+    Returns the number of drifted rows; with ``fix`` they are rewritten.
+    """
+    drifted = 0
+    posts = Post.objects.order_by().annotate(
+        actual=_count(Comment, 'post')).exclude(
+        comment_count=F('actual')).values_list('pk', 'actual')
+    for pk, actual in posts.iterator():
+        drifted += 1
+        if fix:
+            touch(Post, [pk], comment_count=actual)
+
+    users = User.objects.order_by().annotate(
+        actual_posts=_count(Post, 'author'),
+        actual_followers=_count(Follow, 'author'),
+        actual_following=_count(Follow, 'user'),
+    ).values_list('pk', 'counters__posts', 'counters__followers',
+                  'counters__following', 'actual_posts',
+                  'actual_followers', 'actual_following')
+    fixed = []
+    for pk, *stored, posts, followers, following in users.iterator():
+        if stored == [posts, followers, following]:
+            continue
+        drifted += 1
+        if fix:
+            UserCounters.objects.update_or_create(
+                user_id=pk, defaults={'posts': posts,
+                                      'followers': followers,
+                                      'following': following})
+            fixed.append(pk)
+    timeline.followers_changed(fixed)
+    return drifted
@@ -0,0 +1,95 @@
+import zipfile
+
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .counters import get_counters
+from .models import Comment, Post
+
+CHUNK_SIZE = 64 * 1024
+ROWS_PER_QUERY = 2000
+
+encoder = DjangoJSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def records(user):
+    """The user, their posts and their comments as dicts, read in chunks."""
+    counters = get_counters(user)
+    yield {'type': 'user', 'username': user.username,
+           'first_name': user.first_name, 'last_name': user.last_name,
+           'date_joined': user.date_joined, 'posts': counters.posts,
+           'followers': counters.followers, 'following': counters.following}
+    posts = Post.objects.filter(author=user).order_by('id').values_list(
+        'id', 'text', 'pub_date', 'group__slug', 'image')
+    for pk, text, pub_date, group, image in posts.iterator(ROWS_PER_QUERY):
+        yield {'type': 'post', 'id': pk, 'text': text, 'pub_date': pub_date,
+               'group': group, 'image': image or None}
+    comments = Comment.objects.filter(author=user).order_by('id').values_list(
+        'id', 'post_id', 'text', 'created')
+    for pk, post_id, text, created in comments.iterator(ROWS_PER_QUERY):
+        yield {'type': 'comment', 'id': pk, 'post': post_id, 'text': text,
+               'created': created}
+
+
+def ndjson(user):
+    """NDJSON export in chunks of about ``CHUNK_SIZE`` bytes."""
+    chunk, size = [], 0
+    for record in records(user):
+        line = (encoder.encode(record) + '\n').encode()
+        chunk.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield b''.join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield b''.join(chunk)
+
+
+class StreamBuffer:
+    """Write-only file for ZipFile whose contents are taken as they come."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def archive(user):
+    """Zip with ``<username>.ndjson`` and the images of the user's posts.
+
+    The archive is built on the fly: the output is not seekable, so
+    ZipFile writes sizes after each member instead of seeking back.
+    """
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        with zf.open('%s.ndjson' % user.username, 'w',
+                     force_zip64=True) as member:
+            for chunk in ndjson(user):
+                member.write(chunk)
+                yield buffer.pop()
+        images = Post.objects.filter(author=user).exclude(
+            image='').exclude(image__isnull=True).order_by(
+            'id').values_list('image', flat=True)
+        for name in images.iterator(ROWS_PER_QUERY):
+            if not default_storage.exists(name):
+                continue
+            # картинки уже сжаты - кладём как есть
+            info = zipfile.ZipInfo(name, default_storage.get_modified_time(
+                name).timetuple()[:6])
+            info.compress_type = zipfile.ZIP_STORED
+            with default_storage.open(name) as source, zf.open(
+                    info, 'w', force_zip64=True) as member:
+                for chunk in source.chunks(CHUNK_SIZE):
+                    member.write(chunk)
+                    yield buffer.pop()
+    yield buffer.pop()
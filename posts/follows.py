@@ -0,0 +1,47 @@
+from django.db import transaction
+
+from . import counters, suggestions, timeline
+from .models import Follow, UserCounters
+
+
+def follow(user, author_ids):
+    """Follow several authors in one transaction.
+
+    ``bulk_create`` skips the model signals, so counters, timeline and
+    suggestions are updated here, counters with one query per side.
+    Returns the ids of the newly followed authors.
+    """
+    with transaction.atomic():
+        # блокируем счётчики подписчика: параллельная подписка того же
+        # пользователя подождёт и не посчитает связи дважды
+        UserCounters.objects.select_for_update().filter(user=user).first()
+        existing = set(Follow.objects.filter(
+            user=user, author_id__in=author_ids).values_list(
+            'author_id', flat=True))
+        added = sorted(set(author_ids) - existing - {user.id})
+        if not added:
+            return []
+        Follow.objects.bulk_create(
+            [Follow(user=user, author_id=author_id) for author_id in added])
+        counters.change_user(user.id, following=len(added))
+        counters.change_users(added, followers=1)
+        timeline.followers_changed(added)
+        for author_id in added:
+            timeline.backfill(user.id, author_id)
+        suggestions.follow_changed(user.id, added)
+    return added
+
+
+def unfollow(user, author_ids):
+    """Unfollow several authors in one transaction.
+
+    Edges are deleted through the ORM, so the ``Follow`` signals update
+    counters, timeline and suggestions. Returns the ids of the authors
+    that were followed.
+    """
+    with transaction.atomic():
+        follows = Follow.objects.filter(user=user, author_id__in=author_ids)
+        removed = sorted(follows.values_list('author_id', flat=True))
+        if removed:
+            follows.delete()
+    return removed
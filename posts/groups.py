@@ -0,0 +1,74 @@
+import copy
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, Max
+from django.http import Http404
+
+from .cache import new_version
+from .models import Group
+
+GENERATION_KEY = 'posts:groups:generation'
+GROUP_KEY = 'posts:group:%s:%s'
+DIRECTORY_KEY = 'posts:group-directory:%s'
+
+_lock = threading.Lock()
+_local = {'generation': None, 'groups': {}}
+
+
+def generation():
+    """Token that changes whenever any group is saved or deleted."""
+    value = cache.get(GENERATION_KEY)
+    if value is None:
+        cache.add(GENERATION_KEY, new_version(), None)
+        value = cache.get(GENERATION_KEY)
+    return value
+
+
+def invalidate():
+    cache.set(GENERATION_KEY, new_version(), None)
+
+
+def get_group_or_404(slug):
+    """Group by slug from the process map, then the shared cache, then DB.
+
+    Both maps are keyed by the generation, so a saved group is never
+    served stale for longer than one cache round trip.
+    """
+    current = generation()
+    with _lock:
+        if _local['generation'] != current:
+            _local['generation'], _local['groups'] = current, {}
+        group = _local['groups'].get(slug)
+    if group is None:
+        key = GROUP_KEY % (current, slug)
+        group = cache.get(key)
+        if group is None:
+            try:
+                group = Group.objects.get(slug=slug)
+            except Group.DoesNotExist:
+                raise Http404('Нет группы %s' % slug)
+            cache.set(key, group, settings.GROUP_CACHE_TIMEOUT)
+        with _lock:
+            if _local['generation'] == current:
+                _local['groups'][slug] = group
+    # копия - чтобы вызывающий код не менял общий объект
+    return copy.copy(group)
+
+
+def directory():
+    """Groups with their post counts and latest post date, most active first.
+
+    One aggregate query, cached for ``GROUP_DIRECTORY_TIMEOUT`` seconds
+    and dropped as soon as a group changes.
+    """
+    key = DIRECTORY_KEY % generation()
+    groups = cache.get(key)
+    if groups is None:
+        groups = list(Group.objects.annotate(
+            post_count=Count('posts'),
+            last_post=Max('posts__pub_date'),
+        ).order_by(F('last_post').desc(nulls_last=True), 'title'))
+        cache.set(key, groups, settings.GROUP_DIRECTORY_TIMEOUT)
+    return groups
@@ -0,0 +1,127 @@
+import os
+from io import BytesIO
+
+from PIL import Image, ImageOps, ImageSequence, features
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+
+EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif'}
+
+
+def output_format(image):
+    fmt = settings.POST_IMAGE_FORMAT
+    if fmt == 'WEBP' and not features.check('webp'):
+        fmt = 'JPEG'
+    if fmt == 'JPEG' and image.mode in ('RGBA', 'LA'):
+        # у JPEG нет прозрачности
+        fmt = 'PNG'
+    return fmt
+
+
+def process_upload(upload):
+    """Validate an uploaded picture and re-encode it for storage.
+
+    The picture is rotated by its EXIF orientation, scaled down to fit
+    ``POST_IMAGE_MAX_SIZE`` and saved as ``POST_IMAGE_FORMAT`` without
+    EXIF and other metadata. The colour profile is kept unless the
+    colour mode had to be converted. Animated pictures are scaled frame
+    by frame and saved as animated WebP (GIF without WebP support).
+    """
+    try:
+        return reencode(upload)
+    except (OSError, Image.DecompressionBombError):
+        # verify() у ImageField не декодирует данные: обрезанный JPEG
+        # проходит проверку формы и ломается только здесь
+        raise ValidationError(
+            'Не удалось прочитать картинку: файл повреждён.',
+            code='image_broken')
+
+
+def reencode(upload):
+    upload.seek(0)
+    image = Image.open(upload)
+    width, height = image.size
+    min_side = settings.POST_IMAGE_MIN_SIZE
+    if width < min_side or height < min_side:
+        raise ValidationError(
+            'Картинка слишком маленькая: нужно не меньше %(size)s точек '
+            'по каждой стороне.', params={'size': min_side},
+            code='image_too_small')
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Картинка слишком большая: не больше %(mp)s мегапикселей.',
+            params={'mp': settings.POST_IMAGE_MAX_PIXELS // 10 ** 6},
+            code='image_too_large')
+    if getattr(image, 'is_animated', False):
+        return reencode_animation(image, upload.name)
+
+    icc_profile = image.info.get('icc_profile')
+    mode = image.mode
+    image = ImageOps.exif_transpose(image)
+    if image.mode == 'P':
+        image = image.convert(
+            'RGBA' if 'transparency' in image.info else 'RGB')
+    elif image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+        image = image.convert('RGB')
+    if image.mode != mode:
+        # профиль описывает исходные цвета (например, CMYK), к
+        # пересчитанным в RGB он не подходит
+        icc_profile = None
+    max_side = settings.POST_IMAGE_MAX_SIZE
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    fmt = output_format(image)
+    options = {'optimize': True}
+    if fmt in ('WEBP', 'JPEG'):
+        options['quality'] = settings.POST_IMAGE_QUALITY
+    if fmt == 'JPEG':
+        options['progressive'] = True
+        if image.mode == 'LA':
+            image = image.convert('L')
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    output = BytesIO()
+    image.save(output, fmt, **options)
+    return stored_file(output, upload.name, fmt)
+
+
+def reencode_animation(image, name):
+    max_side = settings.POST_IMAGE_MAX_SIZE
+    width, height = image.size
+    scale = min(1, max_side / max(width, height))
+    # кадры держим в памяти уменьшенными: их суммарный размер
+    # ограничен так же, как размер одной картинки
+    if (width * scale) * (height * scale) * image.n_frames > (
+            settings.POST_IMAGE_MAX_PIXELS):
+        raise ValidationError(
+            'Анимация слишком большая: не больше %(mp)s мегапикселей '
+            'во всех кадрах.',
+            params={'mp': settings.POST_IMAGE_MAX_PIXELS // 10 ** 6},
+            code='animation_too_large')
+    frames, durations = [], []
+    for frame in ImageSequence.Iterator(image):
+        durations.append(frame.info.get('duration', 100))
+        frame = frame.convert('RGBA')
+        frame.thumbnail((max_side, max_side), Image.LANCZOS)
+        frames.append(frame)
+
+    options = {'save_all': True, 'append_images': frames[1:],
+               'duration': durations, 'loop': image.info.get('loop', 0)}
+    if settings.POST_IMAGE_FORMAT == 'WEBP' and features.check('webp_anim'):
+        fmt = 'WEBP'
+        options['quality'] = settings.POST_IMAGE_QUALITY
+    else:
+        fmt = 'GIF'
+        # каждый кадр целиком заменяет предыдущий
+        options['disposal'] = 2
+    output = BytesIO()
+    frames[0].save(output, fmt, **options)
+    return stored_file(output, name, fmt)
+
+
+def stored_file(output, name, fmt):
+    name = '%s.%s' % (os.path.splitext(os.path.basename(name))[0],
+                      EXTENSIONS[fmt])
+    return ContentFile(output.getvalue(), name=name)
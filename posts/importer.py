@@ -0,0 +1,175 @@
+import csv
+import json
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import counters, scores, search, timeline
+from .models import (Comment, Group, ImportCheckpoint, Post,
+                     UserCounters)
+
+User = get_user_model()
+
+CSV_FIELDS = ('author', 'group', 'text', 'pub_date')
+
+
+def read_records(f, fmt):
+    """Yield post records from a JSONL or CSV stream.
+
+    A JSONL line is ``{"author", "group", "text", "pub_date",
+    "comments": [{"author", "text", "created"}]}``; CSV rows have the
+    ``CSV_FIELDS`` columns and no comments.
+    """
+    if fmt == 'csv':
+        for row in csv.DictReader(f):
+            yield {name: row.get(name) or None for name in CSV_FIELDS}
+        return
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def parse_date(value):
+    if not value:
+        return None
+    date = parse_datetime(value)
+    if date is None:
+        raise ValueError('Неверная дата: %s' % value)
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    return date
+
+
+class Importer:
+    """Insert posts and their comments in batches with ``bulk_create``.
+
+    Authors and groups are resolved through maps loaded once; unknown
+    authors are created when ``create_authors`` is set and skipped
+    otherwise, unknown groups are created when ``create_groups`` is set.
+    The number of records imported from ``source`` is stored with every
+    batch, in the same transaction.
+    """
+
+    def __init__(self, source, create_authors=False, create_groups=False):
+        self.source = source
+        self.create_authors = create_authors
+        self.create_groups = create_groups
+        self.authors = dict(User.objects.values_list('username', 'id'))
+        self.groups = dict(Group.objects.values_list('slug', 'id'))
+        self.stats = Counter()
+
+    def checkpoint(self):
+        """Number of records of the source imported so far."""
+        return ImportCheckpoint.objects.filter(
+            source=self.source).values_list('done', flat=True).first() or 0
+
+    def restart(self):
+        ImportCheckpoint.objects.filter(source=self.source).delete()
+
+    def _save_checkpoint(self, done):
+        if not ImportCheckpoint.objects.filter(source=self.source).update(
+                done=done):
+            ImportCheckpoint.objects.create(source=self.source, done=done)
+
+    def _allocate_ids(self, model, objects):
+        # PostgreSQL возвращает id из bulk_create сам и двигает
+        # последовательность; SQLite - нет, и id выдаём здесь
+        if connection.features.can_return_ids_from_bulk_insert:
+            return
+        next_id = (model.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+        for offset, obj in enumerate(objects):
+            obj.id = next_id + offset
+
+    def _resolve(self, records):
+        names = {record.get('author') for record in records}
+        for record in records:
+            names.update(c.get('author') for c in record.get('comments', ()))
+        missing = sorted(name for name in names - set(self.authors) if name)
+        if missing and self.create_authors:
+            User.objects.bulk_create(
+                [User(username=name, password='!') for name in missing])
+            created = dict(User.objects.filter(
+                username__in=missing).values_list('username', 'id'))
+            UserCounters.objects.bulk_create(
+                [UserCounters(user_id=pk) for pk in created.values()])
+            self.authors.update(created)
+            self.stats['authors'] += len(missing)
+        slugs = {record.get('group') for record in records}
+        missing = sorted(slug for slug in slugs - set(self.groups) if slug)
+        if missing and self.create_groups:
+            Group.objects.bulk_create(
+                [Group(slug=slug, title=slug, description='') for slug in
+                 missing])
+            self.groups.update(Group.objects.filter(
+                slug__in=missing).values_list('slug', 'id'))
+            self.stats['groups'] += len(missing)
+
+    def import_batch(self, records, done):
+        """Insert one batch of records in a single transaction.
+
+        ``done`` is the number of source records imported once the batch
+        is in; it is saved with the batch, so a batch is never committed
+        without being counted.
+        """
+        with transaction.atomic():
+            # первая запись транзакции: на SQLite она берёт блокировку
+            # базы на запись до коммита, и вставки сайта не займут id,
+            # выделенные ниже
+            self._save_checkpoint(done)
+            self._resolve(records)
+            posts = []
+            for record in records:
+                author_id = self.authors.get(record.get('author'))
+                if author_id is None or not record.get('text'):
+                    self.stats['skipped'] += 1
+                    continue
+                post = Post(author_id=author_id,
+                            group_id=self.groups.get(record.get('group')),
+                            text=record['text'])
+                post.imported_date = parse_date(record.get('pub_date'))
+                post.imported_comments = []
+                for item in record.get('comments', ()):
+                    comment_author = self.authors.get(item.get('author'))
+                    if comment_author is None or not item.get('text'):
+                        self.stats['skipped_comments'] += 1
+                        continue
+                    comment = Comment(author_id=comment_author,
+                                      text=item['text'])
+                    comment.imported_date = parse_date(item.get('created'))
+                    post.imported_comments.append(comment)
+                    post.comment_count += 1
+                posts.append(post)
+
+            self._allocate_ids(Post, posts)
+            Post.objects.bulk_create(posts)
+            comments = []
+            for post in posts:
+                for comment in post.imported_comments:
+                    comment.post_id = post.id
+                    comments.append(comment)
+            self._allocate_ids(Comment, comments)
+            Comment.objects.bulk_create(comments)
+            # auto_now_add выставляет текущее время при вставке -
+            # исходные даты возвращаем отдельным обновлением
+            dated = [post for post in posts if post.imported_date]
+            for post in dated:
+                post.pub_date = post.updated = post.imported_date
+            Post.objects.bulk_update(dated, ['pub_date', 'updated'])
+            dated = [c for c in comments if c.imported_date]
+            for comment in dated:
+                comment.created = comment.updated = comment.imported_date
+            Comment.objects.bulk_update(dated, ['created', 'updated'])
+
+            for author_id, n in Counter(p.author_id for p in posts).items():
+                counters.change_user(author_id, posts=n)
+            timeline.fan_out(posts)
+            search.index_posts(posts)
+            scores.rebuild([post.id for post in posts])
+        self.stats['posts'] += len(posts)
+        self.stats['comments'] += len(comments)
+        return len(posts), len(comments)
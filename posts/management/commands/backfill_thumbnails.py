@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+def build(job):
+    post_id, name = job
+    try:
+        thumbnails.generate(post_id, name)
+        return None
+    except Exception as e:
+        return '%s: %s' % (name, e)
+
+
+class Command(BaseCommand):
+    help = 'Готовит миниатюры для уже загруженных картинок постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--all', action='store_true',
+                            help='Пересоздать и уже готовые миниатюры.')
+
+    def handle(self, *args, **options):
+        images = Post.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            images = images.filter(thumbnails_ready__isnull=True)
+        jobs = list(images.values_list('id', 'image').iterator())
+        results = thumbnails.run_parallel(build, jobs, options['workers'])
+        errors = [error for error in results if error]
+        for error in errors:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            'Обработано картинок: %s, ошибок: %s' % (len(jobs), len(errors))))
@@ -0,0 +1,83 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (setup_test_environment,
+                               teardown_test_environment)
+
+from posts import benchmark
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный прогон ленты: заполняет временную базу '
+            'синтетическими данными и замеряет время, число запросов '
+            'и память для основных страниц.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument('--posts', type=int, default=2000)
+        parser.add_argument('--comments', type=int, default=5000)
+        parser.add_argument('--follows', type=int, default=10,
+                            help='Подписок на пользователя.')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Зерно генератора данных.')
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--cold', action='store_true',
+                            help='Очищать кеш перед каждым запросом.')
+        parser.add_argument('--only', nargs='+', metavar='VIEW',
+                            help='Замерять только эти страницы.')
+        parser.add_argument('--output', help='Куда записать JSON.')
+        parser.add_argument('--compare', metavar='BASELINE',
+                            help='JSON прошлого прогона для сравнения.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Допустимый рост времени и памяти.')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        # временная база и свой кеш: прогон не трогает данные сайта
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with benchmark.private_cache():
+                benchmark.seed(
+                    users=options['users'], groups=options['groups'],
+                    posts=options['posts'], comments=options['comments'],
+                    follows=options['follows'], random_seed=options['seed'])
+                results = benchmark.run(
+                    iterations=options['iterations'],
+                    warmup=options['warmup'], cold=options['cold'],
+                    only=options['only'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        results['meta']['dataset'] = {
+            name: options[name] for name in
+            ('users', 'groups', 'posts', 'comments', 'follows', 'seed')}
+
+        report = json.dumps(results, indent=2, ensure_ascii=False)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report + '\n')
+        else:
+            self.stdout.write(report)
+
+        if baseline is None:
+            return
+        regressions = 0
+        for name, metric, old, new, change, regressed in benchmark.compare(
+                baseline, results, options['tolerance']):
+            line = '%-14s %-9s %10s -> %-10s %+.0f%%' % (
+                name, metric, old, new, change * 100)
+            if regressed:
+                regressions += 1
+                line = self.style.ERROR(line)
+            self.stdout.write(line)
+        if regressions:
+            raise CommandError('Регрессий: %s' % regressions)
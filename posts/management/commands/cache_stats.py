@@ -0,0 +1,27 @@
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания, промахи и вытеснения общего кеша.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alias', default='default')
+        parser.add_argument('--reset', action='store_true',
+                            help='Обнулить статистику.')
+
+    def handle(self, *args, **options):
+        cache = caches[options['alias']]
+        if not hasattr(cache, 'stats'):
+            raise CommandError('Бэкенд %s не ведёт статистику.'
+                               % type(cache).__name__)
+        stats = cache.stats()
+        lookups = stats['hits'] + stats['misses']
+        ratio = stats['hits'] / lookups if lookups else 0
+        self.stdout.write('hits: %(hits)s\nmisses: %(misses)s\n'
+                          'evictions: %(evictions)s' % stats)
+        self.stdout.write('hit ratio: %.1f%%' % (ratio * 100))
+        self.stdout.write('entries: %(entries)s / %(max_entries)s\n'
+                          'size: %(size)s / %(max_size)s bytes' % stats)
+        if options['reset']:
+            cache.reset_stats()
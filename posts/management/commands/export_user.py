@@ -0,0 +1,35 @@
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import export
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Выгружает посты и комментарии пользователя в NDJSON или zip.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--format', choices=('ndjson', 'zip'),
+                            default='ndjson')
+        parser.add_argument('--output',
+                            help='Файл для выгрузки (по умолчанию stdout).')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError('Нет пользователя %s' % options['username'])
+        chunks = (export.archive(user) if options['format'] == 'zip'
+                  else export.ndjson(user))
+        if options['output']:
+            with open(options['output'], 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+        else:
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
@@ -0,0 +1,77 @@
+import itertools
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from posts.importer import Importer, read_records
+
+
+class Command(BaseCommand):
+    help = ('Импортирует посты с комментариями из JSONL или CSV пачками. '
+            'После сбоя повторный запуск продолжает с последней '
+            'сохранённой пачки.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл .jsonl или .csv.')
+        parser.add_argument('--format', choices=('jsonl', 'csv'),
+                            help='По умолчанию - по расширению файла.')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Постов в одной транзакции.')
+        parser.add_argument('--checkpoint',
+                            help='Имя отметки с числом уже импортированных '
+                                 'записей (по умолчанию - полный путь '
+                                 'файла). Отметка хранится в базе.')
+        parser.add_argument('--restart', action='store_true',
+                            help='Начать с начала файла.')
+        parser.add_argument('--create-authors', action='store_true',
+                            help='Создавать неизвестных авторов.')
+        parser.add_argument('--create-groups', action='store_true',
+                            help='Создавать неизвестные группы.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or (
+            'csv' if path.lower().endswith('.csv') else 'jsonl')
+        importer = Importer(
+            options['checkpoint'] or os.path.abspath(path),
+            create_authors=options['create_authors'],
+            create_groups=options['create_groups'])
+        if options['restart']:
+            importer.restart()
+        done = importer.checkpoint()
+        if done:
+            self.stdout.write('Продолжаем после записи %s' % done)
+
+        resumed, start = done, time.monotonic()
+        with open(path, newline='', encoding='utf-8') as f:
+            records = itertools.islice(read_records(f, fmt), done, None)
+            while True:
+                try:
+                    batch = list(itertools.islice(records,
+                                                  options['batch_size']))
+                    if not batch:
+                        break
+                    importer.import_batch(batch, done + len(batch))
+                except (KeyError, TypeError, ValueError, DatabaseError) as e:
+                    raise CommandError(
+                        'Ошибка в пачке с записи %s: %s. Импортированное '
+                        'сохранено, повторный запуск продолжит с неё.'
+                        % (done + 1, e))
+                done += len(batch)
+                self.stdout.write(
+                    'Записей: %s, постов: %s, комментариев: %s '
+                    '(%.0f записей/с)' % (
+                        done, importer.stats['posts'],
+                        importer.stats['comments'],
+                        (done - resumed) / max(time.monotonic() - start,
+                                               1e-6)))
+
+        stats = importer.stats
+        self.stdout.write(self.style.SUCCESS(
+            'Готово: постов %s, комментариев %s, новых авторов %s, '
+            'новых групп %s, пропущено постов %s, комментариев %s' % (
+                stats['posts'], stats['comments'], stats['authors'],
+                stats['groups'], stats['skipped'],
+                stats['skipped_comments'])))
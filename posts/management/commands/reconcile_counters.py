@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики постов, комментариев и подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать расхождения.')
+
+    def handle(self, *args, **options):
+        drifted = reconcile(fix=not options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write('Расхождений: %s' % drifted)
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                'Исправлено расхождений: %s' % drifted))
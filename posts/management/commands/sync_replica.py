@@ -0,0 +1,43 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def sync(primary, replica, pages=1024):
+    """Copy the primary SQLite file into the replica with the backup API.
+
+    Readers of the replica keep seeing the previous copy until the
+    backup finishes.
+    """
+    source = sqlite3.connect(primary)
+    target = sqlite3.connect(replica)
+    try:
+        source.backup(target, pages=pages)
+    finally:
+        target.close()
+        source.close()
+
+
+class Command(BaseCommand):
+    help = 'Обновляет локальную базу-реплику копией основной базы.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Повторять каждые N секунд.')
+
+    def handle(self, *args, **options):
+        alias = settings.REPLICA_DATABASE
+        if not alias:
+            raise CommandError('Реплика не настроена (REPLICA_DATABASE).')
+        primary = settings.DATABASES['default']['NAME']
+        replica = settings.DATABASES[alias]['NAME']
+        while True:
+            start = time.monotonic()
+            sync(primary, replica)
+            self.stdout.write('Реплика обновлена за %.2f с' % (
+                time.monotonic() - start))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from posts import thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Фоновый обработчик очереди миниатюр картинок постов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument('--batch', type=int, default=20)
+        parser.add_argument('--sleep', type=float, default=1.0,
+                            help='Пауза в секундах, когда очередь пуста.')
+        parser.add_argument('--once', action='store_true',
+                            help='Разобрать очередь и выйти.')
+
+    def handle(self, *args, **options):
+        while True:
+            jobs = thumbnails.claim(options['batch'])
+            if jobs:
+                done = sum(thumbnails.run_parallel(thumbnails.run, jobs,
+                                                   options['workers']))
+                self.stdout.write('Готово миниатюр: %s из %s'
+                                  % (done, len(jobs)))
+                continue
+            if options['once']:
+                return
+            connection.close()
+            time.sleep(options['sleep'])
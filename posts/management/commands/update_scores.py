@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import scores
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает оценки постов для лент "В тренде" и "Обсуждаемое".'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Повторять каждые N секунд.')
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.monotonic()
+            scored = scores.rebuild()
+            self.stdout.write('Оценено постов: %s за %.2f с' % (
+                scored, time.monotonic() - start))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import suggestions
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает подсказки "Кого почитать" по графу подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Пересчитать подсказки всех пользователей.')
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Повторять каждые N секунд.')
+
+    def handle(self, *args, **options):
+        while True:
+            start = time.monotonic()
+            if options['full']:
+                users = suggestions.rebuild()
+            else:
+                users = suggestions.refresh_stale()
+            self.stdout.write('Обновлены подсказки пользователей: %s '
+                              'за %.2f с' % (users, time.monotonic() - start))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,59 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:23
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Post = apps.get_model('posts', 'Post')
+    Follow = apps.get_model('posts', 'Follow')
+    UserCounters = apps.get_model('posts', 'UserCounters')
+
+    def per(queryset, field):
+        # без order_by() в GROUP BY попадает Meta.ordering модели
+        return dict(queryset.order_by().values_list(field).annotate(
+            models.Count('id')))
+
+    posts = per(Post.objects, 'author')
+    followers = per(Follow.objects, 'author')
+    following = per(Follow.objects, 'user')
+    UserCounters.objects.bulk_create(
+        UserCounters(user_id=pk, posts=posts.get(pk, 0),
+                     followers=followers.get(pk, 0),
+                     following=following.get(pk, 0))
+        for pk in User.objects.values_list('pk', flat=True))
+    for post in Post.objects.order_by().annotate(
+            actual=models.Count('comments')).filter(actual__gt=0):
+        Post.objects.filter(pk=post.pk).update(comment_count=post.actual)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        ('posts', '0004_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserCounters',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='counters', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts', models.PositiveIntegerField(default=0, verbose_name='Записей')),
+                ('followers', models.PositiveIntegerField(default=0, verbose_name='Подписчиков')),
+                ('following', models.PositiveIntegerField(default=0, verbose_name='Подписок')),
+            ],
+            options={
+                'verbose_name': 'Счётчики пользователя',
+                'verbose_name_plural': 'Счётчики пользователей',
+            },
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Комментариев'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
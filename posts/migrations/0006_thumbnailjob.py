@@ -0,0 +1,29 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThumbnailJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.CharField(max_length=255)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('claimed_until', models.DateTimeField(blank=True, null=True)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='thumbnail_jobs', to='posts.Post')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='thumbnailjob',
+            constraint=models.UniqueConstraint(fields=('post', 'image'), name='unique_thumbnail_job'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:52
+
+from django.db import migrations, models
+
+
+def fill_updated(apps, schema_editor):
+    # существующие строки считаем не изменявшимися с момента создания;
+    # у групп даты создания нет - им остаётся время миграции
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Post.objects.update(updated=models.F('pub_date'))
+    Comment.objects.update(updated=models.F('created'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_comment_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата изменения'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='Версия'),
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата изменения'),
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='Версия'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, verbose_name='Дата изменения'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='version',
+            field=models.PositiveIntegerField(default=1, editable=False, verbose_name='Версия'),
+        ),
+        migrations.RunPython(fill_updated, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:55
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_versioning'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostScore',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='score', serialize=False, to='posts.Post')),
+                ('trending', models.FloatField(verbose_name='В тренде')),
+                ('discussed', models.FloatField(blank=True, null=True, verbose_name='Обсуждаемость')),
+                ('last_activity', models.DateTimeField(verbose_name='Последняя активность')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['created'], name='comment_created'),
+        ),
+        migrations.AddIndex(
+            model_name='postscore',
+            index=models.Index(fields=['-trending', '-post'], name='score_trending'),
+        ),
+        migrations.AddIndex(
+            model_name='postscore',
+            index=models.Index(fields=['-discussed', '-post'], name='score_discussed'),
+        ),
+        migrations.AddIndex(
+            model_name='postscore',
+            index=models.Index(fields=['last_activity'], name='score_last_activity'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.6 on 2026-10-18 04:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_follow_suggestions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='thumbnails_ready',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Миниатюры готовы'),
+        ),
+    ]
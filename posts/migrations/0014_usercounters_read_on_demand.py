@@ -0,0 +1,28 @@
+# Generated by Django 2.2.6 on 2026-10-18 04:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_popular(apps, schema_editor):
+    # до этой миграции режим автора выводился из числа подписчиков
+    UserCounters = apps.get_model('posts', 'UserCounters')
+    UserCounters.objects.filter(
+        followers__gte=settings.TIMELINE_FANOUT_LIMIT).update(
+        read_on_demand=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_thumbnails_ready'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercounters',
+            name='read_on_demand',
+            field=models.BooleanField(default=False, verbose_name='Посты читаются при запросе'),
+        ),
+        migrations.RunPython(mark_popular, migrations.RunPython.noop),
+    ]
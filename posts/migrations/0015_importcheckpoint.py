@@ -0,0 +1,22 @@
+# Generated by Django 2.2.6 on 2026-10-18 04:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_usercounters_read_on_demand'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=255, unique=True, verbose_name='Источник')),
+                ('done', models.PositiveIntegerField(default=0, verbose_name='Импортировано записей')),
+                ('updated', models.DateTimeField(auto_now=True, verbose_name='Дата изменения')),
+            ],
+        ),
+    ]
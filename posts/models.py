@@ -5,7 +5,38 @@ from django.urls import reverse
 User = get_user_model()
 
 
-class Group(models.Model):
+class Versioned(models.Model):
+    """Row with a modification time and a version bumped on every save.
+
+    Cache keys and ETags are built from ``version`` (see ``posts.cache``),
+    so they change with the row without looking at its content.
+    """
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
+    version = models.PositiveIntegerField('Версия', default=1,
+                                          editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, update_fields=None, **kwargs):
+        # копия (pk = None) и force_insert - это INSERT: F() в нём
+        # не работает, и версия новой строки начинается с 1
+        bumped = (not self._state.adding and self.pk is not None
+                  and not kwargs.get('force_insert'))
+        if not bumped:
+            self.version = 1
+        else:
+            # увеличиваем в базе, а не в памяти: два параллельных
+            # сохранения не получат одну и ту же версию
+            self.version = models.F('version') + 1
+            if update_fields is not None:
+                update_fields = {*update_fields, 'updated', 'version'}
+        super().save(*args, update_fields=update_fields, **kwargs)
+        if bumped:
+            self.refresh_from_db(fields=['version'])
+
+
+class Group(Versioned):
     title = models.CharField('Имя', max_length=200, help_text='Введите имя группы.\
                             Максимум 200 симоволов.')
     slug = models.SlugField('Адрес', max_length=50, unique=True,
@@ -21,20 +52,46 @@ class Group(models.Model):
         verbose_name_plural = 'Группы'
 
 
-class Post(models.Model):
-    text = models.TextField('Текст', help_text='Введите текст', db_index=True)
+class PostQuerySet(models.QuerySet):
+    def feed(self):
+        return self.select_related('author', 'group')
+
+
+class Post(Versioned):
+    text = models.TextField('Текст', help_text='Введите текст')
     pub_date = models.DateTimeField('Дата публикации',
                                     auto_now_add=True,
                                     help_text='Введите дату публикации')
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                related_name='posts', null=False,
-                               db_index=True, help_text='Автор поста')
+                               db_index=False, help_text='Автор поста')
     group = models.ForeignKey(Group, on_delete=models.SET_NULL,
                               blank=True, null=True, related_name='posts',
-                              db_index=True, help_text='Группа')
+                              db_index=False, help_text='Группа')
     image = models.ImageField('Иллюстрация', upload_to='posts/', blank=True,
                               null=True,
                               help_text='Загрузите иллюстацию к статье')
+    comment_count = models.PositiveIntegerField('Комментариев', default=0,
+                                                editable=False)
+    thumbnails_ready = models.DateTimeField('Миниатюры готовы', null=True,
+                                            blank=True, editable=False)
+
+    objects = PostQuerySet.as_manager()
+
+    UPDATED_IN_DB = ('comment_count', 'thumbnails_ready')
+
+    def save(self, *args, **kwargs):
+        if (not self._state.adding and self.pk is not None
+                and not kwargs.get('force_insert')
+                and kwargs.get('update_fields') is None):
+            # comment_count и thumbnails_ready меняются только запросами
+            # к базе (counters.change_post, thumbnails.generate); полное
+            # сохранение записало бы значения, прочитанные до них
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.UPDATED_IN_DB]
+        super().save(*args, **kwargs)
 
     def get_absolute_url(self):
         return reverse('post', kwargs={'username': self.author.username,
@@ -45,31 +102,159 @@ class Post(models.Model):
 
     class Meta:
         ordering = ['-pub_date']
+        # индексы повторяют запросы лент: фильтр по автору или группе
+        # и сортировка по дате (id - для курсорной навигации);
+        # одиночные индексы внешних ключей заменяют эти составные
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'], name='post_pub_date'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_pub_date'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_pub_date'),
+        ]
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
 
-class Comment(models.Model):
+class Comment(Versioned):
     text = models.TextField('Текст', help_text='Введите текст')
     created = models.DateTimeField('Дата создания', auto_now_add=True)
     post = models.ForeignKey(Post, on_delete=models.CASCADE,
                              related_name='comments', null=False,
-                             db_index=True)
+                             db_index=False)
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                related_name='comments', null=False,
                                db_index=True)
 
+    class Meta:
+        # комментарии поста листаются от новых к старым по курсору;
+        # индекс по post_id отдельно не нужен - он префикс этого
+        indexes = [
+            models.Index(fields=['post', '-created', '-id'],
+                         name='comment_post_created'),
+            # комментарии за последние дни - для пересчёта оценок постов
+            models.Index(fields=['created'], name='comment_created'),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE,
                              related_name='follower', null=False,
-                             db_index=True)
+                             db_index=False)
     author = models.ForeignKey(User, on_delete=models.CASCADE,
                                related_name='following', null=False,
-                               db_index=True)
+                               db_index=False)
 
     class Meta:
+        # (user, author) покрывает уникальное ограничение,
+        # (author, user) - выборку подписчиков автора
         constraints = [
             models.UniqueConstraint(fields=['user', 'author'],
                                     name='unique_follow'),
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='follow_author_user'),
+        ]
+
+
+class FollowSuggestion(models.Model):
+    """Author suggested to the user, see ``posts.suggestions``."""
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='follow_suggestions',
+                             db_index=False)
+    author = models.ForeignKey(User, on_delete=models.CASCADE,
+                               related_name='+')
+    score = models.FloatField('Оценка')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-score'],
+                         name='suggestion_user_score'),
+        ]
+
+
+class StaleSuggestions(models.Model):
+    """User whose follows changed since the suggestions were computed."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                primary_key=True, related_name='+')
+    since = models.DateTimeField(auto_now_add=True)
+
+
+class UserCounters(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                primary_key=True, related_name='counters')
+    posts = models.PositiveIntegerField('Записей', default=0)
+    followers = models.PositiveIntegerField('Подписчиков', default=0)
+    following = models.PositiveIntegerField('Подписок', default=0)
+    # посты не раскладываются по лентам подписчиков, а читаются
+    # при запросе ленты (см. posts.timeline)
+    read_on_demand = models.BooleanField('Посты читаются при запросе',
+                                         default=False)
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='timeline')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE,
+                             related_name='timeline_entries')
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'],
+                                    name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date'],
+                         name='timeline_user_pub_date'),
+        ]
+
+
+class PostScore(models.Model):
+    """Ranks of a post in the trending and most discussed feeds.
+
+    Scores are logarithms of decayed event weights, see ``posts.scores``;
+    only posts with activity in the last ``SCORE_WINDOW`` days have a row.
+    """
+    post = models.OneToOneField(Post, on_delete=models.CASCADE,
+                                primary_key=True, related_name='score')
+    trending = models.FloatField('В тренде')
+    discussed = models.FloatField('Обсуждаемость', null=True, blank=True)
+    last_activity = models.DateTimeField('Последняя активность')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-trending', '-post'],
+                         name='score_trending'),
+            models.Index(fields=['-discussed', '-post'],
+                         name='score_discussed'),
+            models.Index(fields=['last_activity'],
+                         name='score_last_activity'),
+        ]
+
+
+class ThumbnailJob(models.Model):
+    post = models.ForeignKey(Post, on_delete=models.CASCADE,
+                             related_name='thumbnail_jobs')
+    image = models.CharField(max_length=255)
+    created = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    claimed_until = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['post', 'image'],
+                                    name='unique_thumbnail_job'),
+        ]
+
+
+class ImportCheckpoint(models.Model):
+    """Records of an import source already imported (see ``importer``)."""
+    source = models.CharField('Источник', max_length=255, unique=True)
+    done = models.PositiveIntegerField('Импортировано записей', default=0)
+    updated = models.DateTimeField('Дата изменения', auto_now=True)
@@ -0,0 +1,249 @@
+import base64
+import binascii
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+COUNT_KEY = 'posts:count:%s'
+
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, next_cursor=None,
+                 previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<Keyset page of %s items>' % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+
+class KeysetPaginator:
+    """Paginator over an ordered keyset, without COUNT(*) and OFFSET.
+
+    Pages are addressed by opaque cursors built from the ``keys`` of the
+    first and last items: ``after`` moves forward, ``before`` moves back.
+    Keys are model fields or annotations of the queryset; the last key
+    must be unique (usually the primary key).
+    """
+    is_keyset = True
+
+    def __init__(self, object_list, per_page, keys=('-pub_date', '-id')):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.keys = [(key.lstrip('-'), key.startswith('-')) for key in keys]
+
+    def encode_cursor(self, obj):
+        values = []
+        for name, _ in self.keys:
+            value = getattr(obj, name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat')
+                          else str(value))
+        raw = '|'.join(values).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = base64.urlsafe_b64decode(padded.encode()).decode()
+        except (binascii.Error, UnicodeError, ValueError):
+            return None
+        values = values.split('|')
+        if len(values) != len(self.keys):
+            return None
+        try:
+            return [self._key_field(name).to_python(value)
+                    for (name, _), value in zip(self.keys, values)]
+        except ValidationError:
+            return None
+
+    def _key_field(self, name):
+        annotations = self.object_list.query.annotations
+        if name in annotations:
+            return annotations[name].output_field
+        return self.object_list.model._meta.get_field(name)
+
+    def _seek(self, values, forward):
+        condition = Q()
+        for i, (name, desc) in enumerate(self.keys):
+            lookup = 'lt' if desc == forward else 'gt'
+            term = Q(**{'%s__%s' % (name, lookup): values[i]})
+            for j, (prev_name, _) in enumerate(self.keys[:i]):
+                term &= Q(**{prev_name: values[j]})
+            condition |= term
+        return condition
+
+    def _ordering(self, forward):
+        return ['-' + name if desc == forward else name
+                for name, desc in self.keys]
+
+    def get_page(self, after=None, before=None):
+        cursor = self.decode_cursor(before or after) if (
+            before or after) else None
+        forward = cursor is None or not before
+        qs = self.object_list
+        if cursor is not None:
+            qs = qs.filter(self._seek(cursor, forward))
+        items = list(qs.order_by(*self._ordering(forward))[
+            :self.per_page + 1])
+        has_more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if not forward:
+            items.reverse()
+        if not items:
+            return KeysetPage(items, self)
+        if cursor is None:
+            has_next, has_previous = has_more, False
+        elif forward:
+            has_next, has_previous = has_more, True
+        else:
+            has_next, has_previous = True, has_more
+        return KeysetPage(
+            items, self,
+            next_cursor=self.encode_cursor(items[-1]) if has_next else None,
+            previous_cursor=(self.encode_cursor(items[0]) if has_previous
+                             else None),
+        )
+
+    def get_forward_page(self, after=None):
+        """Page for "load more" lists, going forward only.
+
+        ``object_list`` stays an (already evaluated) QuerySet; whether
+        there is a next page is checked with an EXISTS query when the
+        page is full.
+        """
+        cursor = self.decode_cursor(after) if after else None
+        qs = self.object_list.order_by(*self._ordering(True))
+        page = qs.filter(self._seek(cursor, True)) if cursor else qs
+        page = page[:self.per_page]
+        items = list(page)
+        next_cursor = None
+        if len(items) == self.per_page:
+            last = [getattr(items[-1], name) for name, _ in self.keys]
+            if qs.filter(self._seek(last, True)).exists():
+                next_cursor = self.encode_cursor(items[-1])
+        return KeysetPage(page, self, next_cursor=next_cursor)
+
+
+def table_estimate(queryset):
+    """Row count of an unfiltered queryset from planner statistics.
+
+    None when the queryset is filtered or the database has no statistics
+    (SQLite fills ``sqlite_stat1`` only after ``ANALYZE``).
+    """
+    if queryset.query.where:
+        return None
+    conn = connections[queryset.db]
+    table = queryset.model._meta.db_table
+    with conn.cursor() as cursor:
+        if conn.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s',
+                           [table])
+        elif conn.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                           "AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s '
+                           'LIMIT 1', [table])
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    estimate = int(float(str(row[0]).split()[0]))
+    # у ещё не проанализированных таблиц postgres отдаёт -1 или 0
+    return estimate if estimate > 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that does not run COUNT(*) on every request.
+
+    The total is taken from ``count`` when the caller knows it (e.g. from
+    denormalized counters), else from table statistics for unfiltered
+    querysets, else from an exact count cached for
+    ``PAGINATION_COUNT_TIMEOUT`` seconds. Page numbers near the end may
+    therefore be off by a little, but the estimate never cuts a page
+    short: each page fetches one extra row to find out whether there is
+    a next one and corrects the count by what it saw.
+    """
+    is_estimated = True
+
+    def __init__(self, object_list, per_page, count=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        if count is not None:
+            self.count = count
+
+    @cached_property
+    def count(self):
+        query = str(self.object_list.query).encode()
+        key = COUNT_KEY % hashlib.md5(query).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = table_estimate(self.object_list)
+            if count is None:
+                count = self.object_list.count()
+            cache.set(key, count, settings.PAGINATION_COUNT_TIMEOUT)
+        return count
+
+    def _correct_count(self, count):
+        self.count = count
+        self.__dict__.pop('num_pages', None)
+
+    def validate_number(self, number):
+        # верхнюю границу по оценке не проверяем - её проверяет page()
+        try:
+            if isinstance(number, float) and not number.is_integer():
+                raise ValueError
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы должен быть целым числом')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1')
+        return number
+
+    def get_page(self, number):
+        try:
+            return super().get_page(number)
+        except EmptyPage:
+            # page() уже поправил число по точному COUNT(*)
+            return self.page(self.num_pages)
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        items = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not items and number > 1:
+            # оценка больше настоящего числа постов
+            self._correct_count(self.object_list.count())
+            raise EmptyPage('На этой странице нет результатов')
+        if len(items) > self.per_page:
+            self._correct_count(max(self.count, bottom + len(items)))
+        else:
+            self._correct_count(bottom + len(items))
+        return self._get_page(items[:self.per_page], number, self)
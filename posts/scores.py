@@ -0,0 +1,129 @@
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Comment, Post, PostScore, UserCounters
+
+EPOCH = datetime(2020, 1, 1, tzinfo=timezone.utc)
+CHUNK = 500
+RANK_KEYS = ('-rank', '-id')
+
+
+def log_weight(when, weight, half_life):
+    """ln of ``weight * 2 ** (hours since EPOCH / half_life)``.
+
+    Every event counts twice as much as one ``half_life`` hours older.
+    Scores anchored at a fixed date never have to be decayed: sorting by
+    them is the same as sorting by weights decayed to the current moment.
+    """
+    hours = (when - EPOCH).total_seconds() / 3600
+    return math.log(weight) + hours / half_life * math.log(2)
+
+
+def log_add(a, b):
+    """ln(e**a + e**b) without overflow; None stands for "no events"."""
+    if a is None or b is None:
+        return b if a is None else a
+    high, low = max(a, b), min(a, b)
+    return high + math.log1p(math.exp(low - high))
+
+
+def reach(followers):
+    # публикация весит как 1 + ln(1 + подписчики) комментариев
+    return 1 + math.log1p(followers or 0)
+
+
+def published_score(pub_date, followers):
+    return log_weight(pub_date, reach(followers),
+                      settings.TRENDING_HALF_LIFE)
+
+
+def add_comment(score, created):
+    score.trending = log_add(score.trending, log_weight(
+        created, 1, settings.TRENDING_HALF_LIFE))
+    score.discussed = log_add(score.discussed, log_weight(
+        created, 1, settings.DISCUSSED_HALF_LIFE))
+    score.last_activity = max(score.last_activity, created)
+
+
+def post_published(post):
+    """Start the scores of a new post from its publication."""
+    followers = UserCounters.objects.filter(
+        user_id=post.author_id).values_list('followers', flat=True).first()
+    PostScore.objects.create(
+        post=post, trending=published_score(post.pub_date, followers),
+        last_activity=post.pub_date)
+
+
+def comments_added(comments):
+    """Fold new comments into the scores of their posts.
+
+    Posts without a score row (older than the window or created in
+    bulk) are scored from scratch by ``rebuild``.
+    """
+    by_post = defaultdict(list)
+    for comment in comments:
+        by_post[comment.post_id].append(comment.created)
+    with transaction.atomic():
+        scores = PostScore.objects.select_for_update().in_bulk(list(by_post))
+        for post_id, score in scores.items():
+            for created in by_post[post_id]:
+                add_comment(score, created)
+            score.save()
+    missing = set(by_post) - set(scores)
+    if missing:
+        rebuild(missing)
+
+
+def rebuild(post_ids=None, now=None):
+    """Recompute scores from the last ``SCORE_WINDOW`` days of activity.
+
+    Without ``post_ids`` every post active in the window is rescored
+    and posts without activity are dropped from the ranking. Returns the
+    number of scored posts.
+    """
+    now = now or timezone.now()
+    since = now - timedelta(days=settings.SCORE_WINDOW)
+    if post_ids is None:
+        post_ids = set(Post.objects.filter(
+            pub_date__gte=since).values_list('id', flat=True))
+        post_ids.update(Comment.objects.filter(
+            created__gte=since).values_list('post_id', flat=True).distinct())
+        PostScore.objects.filter(last_activity__lt=since).delete()
+    post_ids = sorted(post_ids)
+    for start in range(0, len(post_ids), CHUNK):
+        chunk = post_ids[start:start + CHUNK]
+        scores = {}
+        posts = Post.objects.filter(id__in=chunk).values_list(
+            'id', 'pub_date', 'author__counters__followers')
+        for post_id, pub_date, followers in posts:
+            scores[post_id] = PostScore(
+                post_id=post_id,
+                trending=published_score(pub_date, followers),
+                last_activity=pub_date)
+        comments = Comment.objects.filter(
+            post_id__in=chunk, created__gte=since).values_list(
+            'post_id', 'created')
+        for post_id, created in comments:
+            add_comment(scores[post_id], created)
+        with transaction.atomic():
+            PostScore.objects.filter(post_id__in=chunk).delete()
+            PostScore.objects.bulk_create(scores.values())
+    return len(post_ids)
+
+
+def trending():
+    """Posts by trending score, as ``rank``; page with ``RANK_KEYS``."""
+    return Post.objects.feed().filter(score__isnull=False).annotate(
+        rank=F('score__trending')).order_by('-rank', '-id')
+
+
+def most_discussed():
+    return Post.objects.feed().filter(
+        score__discussed__isnull=False).annotate(
+        rank=F('score__discussed')).order_by('-rank', '-id')
@@ -0,0 +1,116 @@
+import re
+
+from django.db import connection, connections
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+
+TABLE = 'posts_post_fts'
+
+WORD = re.compile(r'\w+')
+
+
+def enabled():
+    return connection.vendor == 'sqlite'
+
+
+def index_posts(posts):
+    if not enabled():
+        return
+    rows = [(post.id, post.text) for post in posts]
+    with connection.cursor() as cursor:
+        cursor.executemany('DELETE FROM %s WHERE rowid = %%s' % TABLE,
+                           [(pk,) for pk, _ in rows])
+        cursor.executemany(
+            'INSERT INTO %s (rowid, text) VALUES (%%s, %%s)' % TABLE, rows)
+
+
+def unindex_posts(post_ids):
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany('DELETE FROM %s WHERE rowid = %%s' % TABLE,
+                           [(pk,) for pk in post_ids])
+
+
+def rebuild():
+    if not enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM %s' % TABLE)
+        cursor.execute('INSERT INTO %s (rowid, text) SELECT id, text '
+                       'FROM posts_post' % TABLE)
+
+
+def match_expression(query):
+    """Turn user input into an FTS5 query: all words, the last as a prefix.
+
+    Every word is quoted, so FTS5 operators typed by the user are searched
+    as plain words instead of raising syntax errors.
+    """
+    words = WORD.findall(query)
+    if not words:
+        return None
+    return ' '.join('"%s"' % word for word in words) + '*'
+
+
+def matching_ids(query):
+    """Subquery of ids of posts matching ``query``, for ``id__in``."""
+    return RawSQL('SELECT rowid FROM %s WHERE %s MATCH %%s' % (TABLE, TABLE),
+                  [match_expression(query)])
+
+
+class SearchResults:
+    """Ranked search hits as a sequence that ``Paginator`` can slice."""
+
+    def __init__(self, query, queryset=None):
+        self.expression = match_expression(query)
+        self.queryset = Post.objects.feed() if queryset is None else queryset
+        self._count = None
+
+    @property
+    def connection(self):
+        # индекс читается из той же базы, что и посты: с отстающей
+        # репликой число и страницы не разойдутся с найденными постами
+        return connections[self.queryset.db]
+
+    def count(self):
+        if self._count is None:
+            if self.expression is None:
+                self._count = 0
+            else:
+                with self.connection.cursor() as cursor:
+                    cursor.execute(
+                        'SELECT count(*) FROM %s WHERE %s MATCH %%s'
+                        % (TABLE, TABLE), [self.expression])
+                    self._count = cursor.fetchone()[0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        stop = self.count() if index.stop is None else index.stop
+        if self.expression is None or stop <= start:
+            return []
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT rowid FROM %s WHERE %s MATCH %%s ORDER BY rank '
+                'LIMIT %%s OFFSET %%s' % (TABLE, TABLE),
+                [self.expression, stop - start, start])
+            ids = [row[0] for row in cursor.fetchall()]
+        posts = self.queryset.in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
+
+
+def search_posts(query):
+    if enabled():
+        return SearchResults(query)
+    words = WORD.findall(query)
+    posts = Post.objects.feed() if words else Post.objects.none()
+    for word in words:
+        posts = posts.filter(text__icontains=word)
+    return posts
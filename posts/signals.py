@@ -0,0 +1,70 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import counters, groups, scores, search, suggestions, timeline
+from .models import Comment, Follow, Group, Post, UserCounters
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserCounters.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user(instance.author_id, posts=1)
+        timeline.fan_out([instance])
+        scores.post_published(instance)
+    search.index_posts([instance])
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, posts=-1)
+    search.unindex_posts([instance.id])
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.change_post(instance.post_id, 1)
+        scores.comments_added([instance])
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.change_post(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    groups.invalidate()
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    groups.invalidate()
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user(instance.author_id, followers=1)
+        counters.change_user(instance.user_id, following=1)
+        timeline.followers_changed([instance.author_id])
+        timeline.backfill(instance.user_id, instance.author_id)
+        suggestions.follow_changed(instance.user_id, [instance.author_id])
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, followers=-1)
+    counters.change_user(instance.user_id, following=-1)
+    timeline.followers_changed([instance.author_id])
+    timeline.drop(instance.user_id, instance.author_id)
+    suggestions.follow_changed(instance.user_id, [instance.author_id])
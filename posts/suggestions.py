@@ -0,0 +1,167 @@
+import heapq
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Follow, FollowSuggestion, StaleSuggestions
+
+BATCH = 500
+
+
+class Adjacency:
+    """Neighbours of every node as slices of one integer array.
+
+    Built from ``(node, neighbour)`` pairs sorted by node: ``nodes`` holds
+    the distinct nodes, ``starts`` where their neighbours begin in
+    ``targets``. A few bytes per edge instead of a model instance.
+    """
+
+    def __init__(self, pairs):
+        self.nodes = array('i')
+        self.starts = array('l')
+        self.targets = array('i')
+        for node, neighbour in pairs:
+            if not self.nodes or self.nodes[-1] != node:
+                self.nodes.append(node)
+                self.starts.append(len(self.targets))
+            self.targets.append(neighbour)
+        self.starts.append(len(self.targets))
+
+    def __getitem__(self, node):
+        i = bisect_left(self.nodes, node)
+        if i == len(self.nodes) or self.nodes[i] != node:
+            return ()
+        return self.targets[self.starts[i]:self.starts[i + 1]]
+
+
+class FollowGraph:
+    def __init__(self, following, followers):
+        self.following = Adjacency(following)
+        self.followers = Adjacency(followers)
+
+    @classmethod
+    def load(cls):
+        """The whole follow graph, streamed from the two follow indexes."""
+        edges = Follow.objects.order_by()
+        return cls(
+            edges.order_by('user_id', 'author_id').values_list(
+                'user_id', 'author_id').iterator(),
+            edges.order_by('author_id', 'user_id').values_list(
+                'author_id', 'user_id').iterator())
+
+    @classmethod
+    def around(cls, user_id):
+        """The part of the graph ``score`` looks at for one user.
+
+        Followers of popular authors are skipped by ``score`` anyway,
+        so they are not loaded either.
+        """
+        mine = list(Follow.objects.filter(user_id=user_id).values_list(
+            'author_id', flat=True))
+        followers = list(Follow.objects.filter(
+            author_id__in=mine,
+            author__counters__followers__lte=settings.SUGGESTION_FANOUT_LIMIT,
+        ).order_by('author_id', 'user_id').values_list('author_id', 'user_id'))
+        users = {user_id, *mine, *(user for _, user in followers)}
+        following = Follow.objects.filter(user_id__in=users).order_by(
+            'user_id', 'author_id').values_list('user_id', 'author_id')
+        return cls(following.iterator(), followers)
+
+
+def score(graph, user_id, limit):
+    """Top ``limit`` authors for the user as ``(author_id, score)``.
+
+    Every author followed by someone the user follows scores 1 (friends
+    of friends). Users who follow the same authors as the user are
+    similar by the number of common authors; each of them spreads that
+    similarity over the authors they follow (co-follow). Followers of
+    authors with more than ``SUGGESTION_FANOUT_LIMIT`` followers are not
+    counted as similar: following a popular author says little.
+    """
+    following = graph.following[user_id]
+    scores = defaultdict(float)
+    similar = Counter()
+    for author in following:
+        for candidate in graph.following[author]:
+            scores[candidate] += 1
+        followers = graph.followers[author]
+        if len(followers) <= settings.SUGGESTION_FANOUT_LIMIT:
+            similar.update(followers)
+    similar.pop(user_id, None)
+    for other, common in similar.items():
+        theirs = graph.following[other]
+        for candidate in theirs:
+            scores[candidate] += common / len(theirs)
+    for author in (user_id, *following):
+        scores.pop(author, None)
+    return heapq.nlargest(limit, scores.items(),
+                          key=lambda item: (item[1], -item[0]))
+
+
+def store(graph, user_ids):
+    limit = settings.SUGGESTIONS_PER_USER
+    rows = [FollowSuggestion(user_id=user_id, author_id=author_id,
+                             score=value)
+            for user_id in user_ids
+            for author_id, value in score(graph, user_id, limit)]
+    with transaction.atomic():
+        FollowSuggestion.objects.filter(user_id__in=user_ids).delete()
+        FollowSuggestion.objects.bulk_create(rows)
+        StaleSuggestions.objects.filter(user_id__in=user_ids).delete()
+    return len(rows)
+
+
+def rebuild():
+    """Recompute suggestions of every user that follows someone.
+
+    Returns the number of users processed.
+    """
+    graph = FollowGraph.load()
+    users = list(graph.following.nodes)
+    for start in range(0, len(users), BATCH):
+        store(graph, users[start:start + BATCH])
+    # у тех, кто ни на кого не подписан, подсказок нет
+    FollowSuggestion.objects.exclude(user_id__in=Follow.objects.values(
+        'user_id')).delete()
+    StaleSuggestions.objects.all().delete()
+    return len(users)
+
+
+def refresh_stale(limit=None):
+    """Recompute suggestions of users whose follows changed.
+
+    Each user is scored on the part of the graph around them, so this is
+    cheap enough to run every few seconds. Returns the number of users.
+    """
+    stale = StaleSuggestions.objects.order_by('since').values_list(
+        'user_id', flat=True)
+    user_ids = list(stale[:limit] if limit else stale)
+    for user_id in user_ids:
+        store(FollowGraph.around(user_id), [user_id])
+    return len(user_ids)
+
+
+def follow_changed(user_id, author_ids):
+    """Mark the follower's suggestions stale after follows or unfollows.
+
+    The authors are dropped from the suggestions right away; the rest
+    is recomputed by ``refresh_stale``.
+    """
+    FollowSuggestion.objects.filter(user_id=user_id,
+                                    author_id__in=author_ids).delete()
+    StaleSuggestions.objects.bulk_create(
+        [StaleSuggestions(user_id=user_id)], ignore_conflicts=True)
+
+
+def for_user(user, exclude=None, limit=5):
+    """Suggested authors to show in the "who to follow" panel."""
+    if not user.is_authenticated:
+        return []
+    suggestions = FollowSuggestion.objects.filter(user=user)
+    if exclude is not None:
+        suggestions = suggestions.exclude(author=exclude)
+    return [suggestion.author for suggestion in suggestions.select_related(
+        'author__counters').order_by('-score', 'author_id')[:limit]]
@@ -0,0 +1,43 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from posts import cache, thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(post, size='card'):
+    """The thumbnail of the post image, or None while it is being made.
+
+    Read only: jobs are queued by ``new_post``, ``post_edit`` and
+    ``backfill_thumbnails``, not by rendering a page.
+    """
+    if not post.image or not thumbnails.is_ready(post):
+        return None
+    return thumbnails.get(post.image.name, size)
+
+
+@register.simple_tag
+def page_window(page, size=2):
+    """Page numbers around the current one plus the first and the last.
+
+    None marks a gap, so the number of links does not grow with the
+    number of pages.
+    """
+    last = page.paginator.num_pages
+    numbers = {1, last} | set(range(max(1, page.number - size),
+                                    min(last, page.number + size) + 1))
+    window, previous = [], 0
+    for number in sorted(numbers):
+        if number - previous > 1:
+            window.append(None)
+        window.append(number)
+        previous = number
+    return window
+
+
+@register.simple_tag
+def post_card(post):
+    """Cached image and body of the post card, see ``cache.card_html``."""
+    return mark_safe(cache.card_html(post))
@@ -1,21 +1,51 @@
-from io import BytesIO
+import importlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import zipfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
 from PIL import Image
 
+from django.apps import apps as django_apps
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
 from django.core.cache import cache
 from django.core.files.base import File
-from django.test import Client, TestCase
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, connection
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.template.loader import render_to_string
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
+from yatube import db, instrumentation
+from yatube.cache_backends import SQLiteCache
+
+from . import (benchmark, comments, counters, scores, search, suggestions,
+               thumbnails, timeline, views)
+from .cache import etag, touch, version_key
 from .forms import CommentForm
-from .models import Follow, Group, Post
+from .management.commands import sync_replica
+from .models import (Comment, Follow, FollowSuggestion, Group,
+                     ImportCheckpoint, Post, PostScore, StaleSuggestions,
+                     ThumbnailJob, TimelineEntry, UserCounters)
+from .paginators import KeysetPaginator
 
 
 User = get_user_model()
 
 
+@override_settings(THUMBNAIL_ASYNC=False)
 class TestStringMethods(TestCase):
     def setUp(self):
         self.client = Client()
@@ -29,6 +59,9 @@ class TestStringMethods(TestCase):
         self.user_sarah = User.objects.get(username=self.sarah)
         self.user_olga = User.objects.get(username=self.olga)
         self.user_rick = User.objects.get(username=self.rick)
+        self.media = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings.enable()
         self.client.force_login(self.user_sarah)
         self.group = Group.objects.create(title='Grupo de prueba',
                                           slug='prueba',
@@ -213,17 +246,29 @@ class TestStringMethods(TestCase):
         self.assertNotContains(response, es_mal)
 
     def test_cash(self):
-        Post.objects.create(author=self.user_sarah,
-                            text='1!')
+        post = Post.objects.create(author=self.user_sarah,
+                                   text='1!')
         response = self.client.get(reverse('index'))
         self.assertContains(response,  '1!')
         Post.objects.create(author=self.user_sarah,
                             text='2!')
         response = self.client.get(reverse('index'))
-        self.assertNotContains(response,  '2!')
-        cache.clear()
-        response = self.client.get(reverse('index'))
         self.assertContains(response,  '2!')
+        post.text = '3!'
+        post.save()
+        response = self.client.get(reverse('index'))
+        self.assertContains(response,  '3!')
+        self.assertNotContains(response,  '1!')
+
+    def test_cached_card_not_shared_between_users(self):
+        Post.objects.create(author=self.user_sarah, text='De Sarah')
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Редактировать')
+        self.client.force_login(self.user_olga)
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'De Sarah')
+        self.assertContains(response, 'Пользователь: olga')
+        self.assertNotContains(response, 'Редактировать')
 
     def test_follow(self):
         self.client.post(reverse('profile_follow',
@@ -261,3 +306,1404 @@ class TestStringMethods(TestCase):
 
     def tearDown(self):
         self.client.logout()
+        self.settings.disable()
+        self.media.cleanup()
+
+
+class TestKeysetPagination(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.sarah = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345')
+        for i in range(25):
+            Post.objects.create(author=self.sarah, text='Nota %s' % i)
+        cache.clear()
+
+    def test_walks_forward_and_back(self):
+        paginator = KeysetPaginator(Post.objects.all(), 10)
+        expected = list(Post.objects.order_by('-pub_date', '-id'))
+        first = paginator.get_page()
+        self.assertEqual(list(first), expected[:10])
+        self.assertFalse(first.has_previous())
+        second = paginator.get_page(after=first.next_cursor)
+        self.assertEqual(list(second), expected[10:20])
+        third = paginator.get_page(after=second.next_cursor)
+        self.assertEqual(list(third), expected[20:])
+        self.assertFalse(third.has_next())
+        back = paginator.get_page(before=third.previous_cursor)
+        self.assertEqual(list(back), expected[10:20])
+        self.assertTrue(back.has_next())
+        self.assertTrue(back.has_previous())
+
+    def test_no_count_query(self):
+        paginator = KeysetPaginator(Post.objects.all(), 10)
+        first = paginator.get_page()
+        with self.assertNumQueries(1):
+            paginator.get_page(after=first.next_cursor)
+
+    def test_bad_cursor_gives_first_page(self):
+        paginator = KeysetPaginator(Post.objects.all(), 10)
+        page = paginator.get_page(before='not-a-cursor')
+        self.assertEqual(list(page), list(Post.objects.all()[:10]))
+
+    @override_settings(POSTS_PAGINATION='keyset')
+    def test_feed_links(self):
+        response = self.client.get(reverse('profile',
+                                   kwargs={'username': 'sarah'}))
+        page = response.context['page']
+        self.assertContains(response, '?after=%s' % page.next_cursor)
+        response = self.client.get(reverse('profile',
+                                   kwargs={'username': 'sarah'}),
+                                   {'after': page.next_cursor})
+        self.assertContains(response, 'Nota 14')
+        self.assertContains(response, '?before=')
+
+
+class TestEstimatedPagination(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.sarah = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345')
+        Post.objects.bulk_create(
+            [Post(author=self.sarah, text='Nota %s' % i) for i in range(300)])
+        cache.clear()
+
+    def test_page_window(self):
+        response = self.client.get(reverse('index') + '?page=15')
+        self.assertEqual(response.context['paginator'].num_pages, 30)
+        for number in (1, 13, 14, 16, 17, 30):
+            self.assertContains(response, '?page=%s"' % number)
+        for number in (2, 12, 18, 29):
+            self.assertNotContains(response, '?page=%s"' % number)
+        self.assertContains(response, '&hellip;', count=2)
+
+    @override_settings(POSTS_PAGINATION='estimated')
+    def test_count_is_cached(self):
+        self.client.get(reverse('index'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index') + '?page=2')
+        self.assertTrue(response.context['paginator'].is_estimated)
+        self.assertFalse(any('COUNT' in query['sql']
+                             for query in queries.captured_queries))
+        Post.objects.bulk_create(
+            [Post(author=self.sarah, text='Nueva %s' % i) for i in range(10)])
+        self.assertEqual(self.client.get(reverse('index')).context[
+            'paginator'].num_pages, 30)
+
+    @override_settings(POSTS_PAGINATION='estimated')
+    def test_profile_count_from_counters(self):
+        counters.reconcile()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('profile', args=['sarah']))
+        self.assertEqual(response.context['paginator'].count, 300)
+        self.assertFalse(any('COUNT' in query['sql']
+                             for query in queries.captured_queries))
+
+    @override_settings(POSTS_PAGINATION='estimated')
+    def test_drifted_counters_do_not_hide_posts(self):
+        url = reverse('profile', args=['sarah'])
+        UserCounters.objects.filter(user=self.sarah).update(posts=3)
+        page = self.client.get(url).context['page']
+        self.assertEqual(len(page), 10)
+        self.assertTrue(page.has_next())
+        page = self.client.get(url + '?page=30').context['page']
+        self.assertEqual((page.number, len(page)), (30, 10))
+        self.assertFalse(page.has_next())
+
+        UserCounters.objects.filter(user=self.sarah).update(posts=1000)
+        page = self.client.get(url + '?page=50').context['page']
+        self.assertEqual((page.number, len(page)), (30, 10))
+        self.assertEqual(page.paginator.num_pages, 30)
+
+
+class TestFeedQueries(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.sarah = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345')
+        self.olga = User.objects.create_user(
+            username='olga', email='olga.s@skynet.com', password='54321')
+        self.group = Group.objects.create(title='Grupo de prueba',
+                                          slug='prueba',
+                                          description='Mucho gusto')
+        Follow.objects.create(user=self.olga, author=self.sarah)
+        for i in range(10):
+            post = Post.objects.create(author=self.sarah, group=self.group,
+                                       text='Nota %s' % i)
+            Comment.objects.create(post=post, author=self.olga, text='Ok')
+        self.client.force_login(self.olga)
+        cache.clear()
+
+    def test_feeds_run_constant_queries(self):
+        urls = [
+            reverse('index'),
+            reverse('group_posts', kwargs={'slug': 'prueba'}),
+            reverse('profile', kwargs={'username': 'sarah'}),
+            reverse('follow_index'),
+        ]
+        for url in urls:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertLessEqual(len(queries), 8, url)
+            self.assertContains(response, '1 комментариев', count=10)
+
+
+class TestCommentPages(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.sarah = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345')
+        self.post = Post.objects.create(author=self.sarah, text='Viral')
+        Comment.objects.bulk_create(
+            [Comment(post=self.post, author=self.sarah, text='Nota %s' % i)
+             for i in range(120)])
+        self.url = reverse('post', args=['sarah', self.post.id])
+
+    def test_post_view_shows_first_batch(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertLessEqual(len(queries), 8)
+        self.assertContains(response, 'name="comment_', count=50)
+        # сначала новые комментарии
+        self.assertContains(response, 'Nota 119')
+        self.assertNotContains(response, 'Nota 69<')
+        self.assertContains(response, 'Показать ещё комментарии')
+
+    def test_load_more_walks_all_comments(self):
+        url = reverse('post_comments', args=['sarah', self.post.id])
+        seen = []
+        while url:
+            data = self.client.get(url).json()
+            seen += [item['text'] for item in data['comments']]
+            self.assertEqual(data['html'].count('name="comment_'),
+                             len(data['comments']))
+            url = data['next']
+        self.assertEqual(seen, ['Nota %s' % i for i in range(119, -1, -1)])
+
+
+class TestFeedApi(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.sarah = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345')
+        self.group = Group.objects.create(title='Grupo de prueba',
+                                          slug='prueba',
+                                          description='Mucho gusto')
+        for i in range(5):
+            Post.objects.create(author=self.sarah, group=self.group,
+                                text='Nota %s' % i)
+
+    def test_feeds(self):
+        for url in ('/api/v1/posts/', '/api/v1/group/prueba/posts/',
+                    '/api/v1/users/sarah/posts/'):
+            data = self.client.get(url + '?limit=3').json()
+            self.assertEqual([post['text'] for post in data['results']],
+                             ['Nota 4', 'Nota 3', 'Nota 2'], url)
+            self.assertEqual(data['results'][0]['group'], 'prueba')
+            self.assertIsNone(data['previous'])
+            rest = self.client.get(data['next']).json()
+            self.assertEqual([post['text'] for post in rest['results']],
+                             ['Nota 1', 'Nota 0'], url)
+        self.assertEqual(self.client.get(
+            '/api/v1/group/nada/posts/').status_code, 404)
+
+    def test_conditional_get(self):
+        response = self.client.get('/api/v1/users/sarah/posts/')
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/users/sarah/posts/',
+                                       HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(len(queries), 2)
+
+        Post.objects.create(author=self.sarah, text='Nueva')
+        response = self.client.get('/api/v1/users/sarah/posts/',
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['text'], 'Nueva')
+
+    def test_etag_follows_edits(self):
+        url = '/api/v1/group/prueba/posts/?limit=2'
+        etag = self.client.get(url)['ETag']
+        post = Post.objects.get(text='Nota 3')
+        post.text = 'Nota editada'
+        post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][1]['text'],
+                         'Nota editada')
+
+        etag = response['ETag']
+        Comment.objects.create(post=post, author=self.sarah, text='Hola')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()['results'][1]['comments'], 1)
+
+        etag = response['ETag']
+        self.group.title = 'Otro grupo'
+        self.group.save()
+        self.assertNotEqual(self.client.get(url)['ETag'], etag)
+        # правка поста на другой странице эту страницу не меняет
+        etag = self.client.get(url)['ETag']
+        Post.objects.get(text='Nota 0').save()
+        self.assertEqual(self.client.get(
+            url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class TestFollowApi(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.sarah, self.olga, self.rick = [User.objects.create_user(
+            username=name, email='%s@skynet.com' % name, password='12345')
+            for name in ('sarah', 'olga', 'rick')]
+        self.post = Post.objects.create(author=self.olga, text='De Olga')
+        self.client.force_login(self.sarah)
+
+    def follow(self, url, authors):
+        return self.client.post(url, json.dumps({'authors': authors}),
+                                content_type='application/json')
+
+    def test_bulk_follow(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.follow('/api/v1/follow/',
+                                   ['olga', 'rick', 'nadie', 'sarah'])
+        self.assertEqual(response.json(), {'changed': ['olga', 'rick'],
+                                           'missing': ['nadie']})
+        self.assertLess(len(queries), 20)
+        self.assertEqual(UserCounters.objects.get(user=self.sarah).following,
+                         2)
+        self.assertEqual(UserCounters.objects.get(user=self.olga).followers,
+                         1)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.sarah, post=self.post).exists())
+        self.assertTrue(StaleSuggestions.objects.filter(
+            user=self.sarah).exists())
+        self.assertEqual(self.follow('/api/v1/follow/', ['olga']).json(),
+                         {'changed': [], 'missing': []})
+
+        response = self.client.post('/api/v1/unfollow/', {'author': 'olga'})
+        self.assertEqual(response.json()['changed'], ['olga'])
+        self.assertEqual(Follow.objects.get().author, self.rick)
+        self.assertFalse(TimelineEntry.objects.filter(user=self.sarah,
+                                                      post=self.post).exists())
+        self.assertEqual(counters.reconcile(fix=False), 0)
+
+    def test_errors(self):
+        self.assertEqual(self.client.get('/api/v1/follow/').status_code, 405)
+        for body in ('no json', '[]', '{"authors": "olga"}',
+                     '{"authors": []}'):
+            response = self.client.post('/api/v1/follow/', body,
+                                        content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+        response = Client().post('/api/v1/follow/', {'author': 'olga'})
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(Follow.objects.exists())
+
+
+class TestImportPosts(TestCase):
+    def setUp(self):
+        self.sarah = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345')
+        self.olga = User.objects.create_user(
+            username='olga', email='olga.s@skynet.com', password='54321')
+        Follow.objects.create(user=self.olga, author=self.sarah)
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'posts.jsonl')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def write(self, records):
+        with open(self.path, 'w') as f:
+            for record in records:
+                f.write(record if isinstance(record, str)
+                        else json.dumps(record))
+                f.write('\n')
+
+    def test_import_and_resume(self):
+        records = [{'author': 'sarah', 'group': 'nuevo',
+                    'text': 'Importado %s' % i,
+                    'pub_date': '2019-01-%02dT10:00:00' % (i + 1),
+                    'comments': [{'author': 'kyle', 'text': 'Ok',
+                                  'created': '2019-02-01T10:00:00'}]}
+                   for i in range(5)]
+        self.write(records[:3] + ['{broken'] + records[3:])
+        with self.assertRaises(CommandError):
+            call_command('import_posts', self.path, '--batch-size=2',
+                         '--create-authors', '--create-groups',
+                         stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 2)
+
+        self.write(records[:3] + [records[3]] + records[3:])
+        call_command('import_posts', self.path, '--batch-size=2',
+                     '--create-authors', '--create-groups',
+                     stdout=StringIO())
+        posts = Post.objects.order_by('pub_date')
+        self.assertEqual([post.text for post in posts],
+                         ['Importado %s' % i for i in (0, 1, 2, 3, 3, 4)])
+        self.assertEqual(posts[0].pub_date.day, 1)
+        self.assertEqual(posts[0].group.slug, 'nuevo')
+        self.assertEqual(posts[0].comment_count, 1)
+        comment = Comment.objects.select_related('author').first()
+        self.assertEqual(comment.author.username, 'kyle')
+        self.assertEqual(comment.created.month, 2)
+        self.assertEqual(counters.reconcile(fix=False), 0)
+        self.assertEqual(timeline.timeline(self.olga).count(), 6)
+        self.assertEqual(len(search.search_posts('importado')), 6)
+
+    def test_checkpoint_saved_with_batch(self):
+        self.write([{'author': 'sarah', 'text': 'Importado %s' % i}
+                    for i in range(4)])
+        with mock.patch('posts.importer.search.index_posts',
+                        side_effect=[None, DatabaseError('locked')]):
+            with self.assertRaises(CommandError):
+                call_command('import_posts', self.path, '--batch-size=2',
+                             stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(ImportCheckpoint.objects.get().done, 2)
+        call_command('import_posts', self.path, '--batch-size=2',
+                     stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 4)
+        self.assertEqual(ImportCheckpoint.objects.get().done, 4)
+
+
+class TestExport(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.sarah = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345')
+        self.olga = User.objects.create_user(
+            username='olga', email='olga.s@skynet.com', password='54321')
+        self.media = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings.enable()
+        image = BytesIO()
+        Image.new('RGB', size=(50, 50)).save(image, 'png')
+        self.post = Post.objects.create(
+            author=self.sarah, text='Nota',
+            image=File(image, name='export.png'))
+        for i in range(3):
+            Post.objects.create(author=self.sarah, text='Nota %s' % i)
+        Comment.objects.create(post=self.post, author=self.sarah, text='Ok')
+        Comment.objects.create(post=self.post, author=self.olga, text='Hola')
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media.cleanup()
+
+    def test_ndjson(self):
+        url = reverse('profile_export', args=['sarah'])
+        self.client.force_login(self.olga)
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.sarah)
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        rows = [json.loads(line) for line in
+                b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['type'] for row in rows],
+                         ['user'] + ['post'] * 4 + ['comment'])
+        self.assertEqual(rows[0]['posts'], 4)
+        self.assertEqual(rows[1]['image'], self.post.image.name)
+
+    def test_zip(self):
+        out = os.path.join(self.media.name, 'sarah.zip')
+        call_command('export_user', 'sarah', format='zip', output=out)
+        with zipfile.ZipFile(out) as zf:
+            self.assertEqual(zf.namelist(),
+                             ['sarah.ndjson', self.post.image.name])
+            self.assertEqual(len(zf.read('sarah.ndjson').splitlines()), 6)
+            self.assertEqual(zf.read(self.post.image.name),
+                             self.post.image.read())
+
+
+class TestGroups(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.sarah = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345')
+        self.group = Group.objects.create(title='Grupo de prueba',
+                                          slug='prueba',
+                                          description='Mucho gusto')
+        self.empty = Group.objects.create(title='Vacío', slug='vacio',
+                                          description='Nada')
+        for i in range(3):
+            Post.objects.create(author=self.sarah, group=self.group,
+                                text='Nota %s' % i)
+        cache.clear()
+
+    def group_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        return response, [q['sql'] for q in queries.captured_queries
+                          if 'FROM "posts_group"' in q['sql']]
+
+    def test_group_lookup_is_cached(self):
+        url = reverse('group_posts', args=['prueba'])
+        self.client.get(url)
+        response, queries = self.group_queries(url)
+        self.assertEqual(queries, [])
+        self.assertEqual(response.context['group'], self.group)
+
+        self.group.title = 'Nuevo título'
+        self.group.save()
+        response, queries = self.group_queries(url)
+        self.assertEqual(len(queries), 1)
+        self.assertContains(response, 'Nuevo título')
+        self.assertEqual(self.client.get(
+            reverse('group_posts', args=['nada'])).status_code, 404)
+
+    def test_directory(self):
+        response, queries = self.group_queries(reverse('group_list'))
+        self.assertEqual(len(queries), 1)
+        self.assertEqual([group.slug for group in response.context['groups']],
+                         ['prueba', 'vacio'])
+        self.assertEqual(response.context['groups'][0].post_count, 3)
+        self.assertContains(response, 'Записей: 3')
+
+        _, queries = self.group_queries(reverse('group_list'))
+        self.assertEqual(queries, [])
+        self.empty.delete()
+        response = self.client.get(reverse('group_list'))
+        self.assertEqual(len(response.context['groups']), 1)
+
+
+@override_settings(COMMENT_BATCHING=True, COMMENT_BATCH_SIZE=5,
+                   COMMENT_BATCH_WAIT=0.5)
+class TestCommentBatching(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.sarah = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345')
+        self.post = Post.objects.create(author=self.sarah, text='Viral')
+        self.client.force_login(self.sarah)
+
+    @override_settings(COMMENT_BATCH_WAIT=0)
+    def test_comment_visible_after_redirect(self):
+        response = self.client.post(
+            reverse('add_comment', args=['sarah', self.post.id]),
+            {'text': 'Primero'}, follow=True)
+        self.assertContains(response, 'Primero')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+
+    def submit_concurrently(self, texts):
+        errors = {}
+
+        def submit(text):
+            try:
+                comments.batcher.submit(Comment(
+                    post_id=self.post.id, author=self.sarah, text=text))
+            except Exception as e:
+                errors[text] = e
+
+        threads = [threading.Thread(target=submit, args=[text])
+                   for text in texts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def test_concurrent_comments_share_one_batch(self):
+        batches = []
+        with mock.patch('posts.comments.insert',
+                        lambda items: batches.append(
+                            sorted(c.text for c in items))):
+            errors = self.submit_concurrently(['%s' % i for i in range(5)])
+        self.assertEqual(errors, {})
+        self.assertEqual(batches, [['0', '1', '2', '3', '4']])
+
+    def test_bad_comment_fails_alone(self):
+        def insert(items):
+            if any(c.text == 'malo' for c in items):
+                raise DatabaseError('FOREIGN KEY constraint failed')
+
+        with mock.patch('posts.comments.insert', insert):
+            errors = self.submit_concurrently(['a', 'b', 'malo', 'c', 'd'])
+        self.assertEqual(list(errors), ['malo'])
+
+    def test_failed_batch_fails_every_comment(self):
+        def insert(items):
+            raise RuntimeError('scores')
+
+        with mock.patch('posts.comments.insert', insert):
+            errors = self.submit_concurrently(['a', 'b', 'c', 'd', 'e'])
+        self.assertEqual(sorted(errors), ['a', 'b', 'c', 'd', 'e'])
+        self.assertTrue(all(isinstance(e, RuntimeError)
+                            for e in errors.values()))
+
+
+class TestVersioning(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.sarah = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345')
+        self.client.force_login(self.sarah)
+        self.group = Group.objects.create(title='Grupo de prueba',
+                                          slug='prueba',
+                                          description='Mucho gusto')
+        self.post = Post.objects.create(author=self.sarah, group=self.group,
+                                        text='Primera')
+
+    def test_save_bumps_version(self):
+        self.assertEqual(self.post.version, 1)
+        created = self.post.updated
+        self.client.post(reverse('post_edit', args=['sarah', self.post.id]),
+                         {'text': 'Editada', 'group': self.group.id})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.version, 2)
+        self.assertGreater(self.post.updated, created)
+
+        self.post.text = 'Otra vez'
+        self.post.save(update_fields=['text'])
+        self.assertEqual(self.post.version, 3)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).version, 3)
+
+        self.group.title = 'Grupo nuevo'
+        self.group.save()
+        self.assertEqual(self.group.version, 2)
+
+    def test_copy_starts_at_version_one(self):
+        self.post.save()
+        self.group.save()
+        for obj in (self.post, self.group):
+            original = obj.pk
+            obj.pk = None
+            if obj is self.group:
+                obj.slug = 'copia'
+            obj.save()
+            self.assertNotEqual(obj.pk, original)
+            self.assertEqual(obj.version, 1)
+            self.assertEqual(type(obj).objects.get(pk=original).version, 2)
+        copy = Post.objects.get(pk=self.post.pk)
+        copy.pk = 1000
+        copy.save(force_insert=True)
+        self.assertEqual(Post.objects.get(pk=1000).version, 1)
+
+    def test_comments_bump_post_version(self):
+        self.client.post(reverse('add_comment', args=['sarah', self.post.id]),
+                         {'text': 'Hola'})
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.comment_count, self.post.version), (1, 2))
+        Comment.objects.get().delete()
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.comment_count, self.post.version), (0, 3))
+
+    def test_keys(self):
+        key = version_key(self.post, self.post.group)
+        self.assertEqual(key, version_key(self.post, self.group))
+        self.assertEqual(version_key(self.post),
+                         version_key(self.post, None))
+        touch(Post, [self.post.id])
+        self.post.refresh_from_db()
+        self.assertNotEqual(version_key(self.post, self.group), key)
+        self.assertNotEqual(etag([self.post]),
+                            etag([self.post], 'otra'))
+
+
+class TestPostCards(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.sarah = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345')
+        for i in range(5):
+            Post.objects.create(author=self.sarah, text='Nota %s' % i)
+        cache.clear()
+
+    def rendered_cards(self, url):
+        with mock.patch('posts.cache.render_to_string',
+                        wraps=render_to_string) as render:
+            response = self.client.get(url)
+        return response, render.call_count
+
+    def test_cards_rendered_once(self):
+        _, rendered = self.rendered_cards(reverse('index'))
+        self.assertEqual(rendered, 5)
+        response, rendered = self.rendered_cards(reverse('index'))
+        self.assertEqual(rendered, 0)
+        self.assertContains(response, 'Nota 3')
+
+        post = Post.objects.get(text='Nota 3')
+        post.text = 'Nota editada'
+        post.save()
+        response, rendered = self.rendered_cards(reverse('index'))
+        self.assertEqual(rendered, 1)
+        self.assertContains(response, 'Nota editada')
+        _, rendered = self.rendered_cards(
+            reverse('post', args=['sarah', post.id]))
+        self.assertEqual(rendered, 0)
+
+
+class TestScores(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.sarah = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345')
+        self.olga = User.objects.create_user(
+            username='olga', email='olga.s@skynet.com', password='54321')
+        self.quiet = Post.objects.create(author=self.sarah, text='Silencio')
+        self.hot = Post.objects.create(author=self.sarah, text='Caliente')
+        self.old = Post.objects.create(author=self.sarah, text='Antiguo')
+
+    def test_feeds(self):
+        for text in ('Uno', 'Dos'):
+            Comment.objects.create(post=self.hot, author=self.olga, text=text)
+        comments.insert([Comment(post=self.old, author=self.olga,
+                                 text='Tres')])
+        self.assertEqual(list(scores.trending())[:2], [self.hot, self.old])
+        self.assertEqual(list(scores.most_discussed()),
+                         [self.hot, self.old])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('discussed'))
+        self.assertLessEqual(len(queries), 3)
+        self.assertContains(response, 'Caliente')
+        self.assertNotContains(response, 'Silencio')
+        self.assertContains(self.client.get(reverse('trending')), 'Silencio')
+
+    def test_pages_by_cursor(self):
+        for i in range(12):
+            Post.objects.create(author=self.sarah, text='Nota %s' % i)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('trending'))
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('COUNT', sql)
+        self.assertNotIn('OFFSET', sql)
+        page = response.context['page']
+        seen = list(page)
+        page = self.client.get(reverse('trending') + '?after=' +
+                               page.next_cursor).context['page']
+        self.assertFalse(page.has_next())
+        seen += list(page)
+        self.assertEqual(seen, list(scores.trending()))
+        self.assertEqual(len(seen), 15)
+
+    def test_rebuild_matches_incremental(self):
+        Comment.objects.create(post=self.hot, author=self.olga, text='Uno')
+        Comment.objects.create(post=self.old, author=self.olga, text='Dos')
+        incremental = {s.post_id: (s.trending, s.discussed)
+                       for s in PostScore.objects.all()}
+        self.assertEqual(scores.rebuild(), 3)
+        for score in PostScore.objects.all():
+            trending, discussed = incremental[score.post_id]
+            self.assertAlmostEqual(score.trending, trending)
+            if discussed is None:
+                self.assertIsNone(score.discussed)
+            else:
+                self.assertAlmostEqual(score.discussed, discussed)
+
+    def test_decay_and_window(self):
+        now = timezone.now()
+        Comment.objects.create(post=self.hot, author=self.olga, text='Uno')
+        for text in ('Dos', 'Tres', 'Cuatro'):
+            Comment.objects.create(post=self.old, author=self.olga, text=text)
+        # три комментария двухдневной давности весят меньше одного свежего
+        Post.objects.filter(pk=self.old.pk).update(
+            pub_date=now - timedelta(days=2))
+        Comment.objects.filter(post=self.old).update(
+            created=now - timedelta(days=2))
+        scores.rebuild()
+        self.assertEqual(list(scores.trending())[0], self.hot)
+
+        later = now + timedelta(days=settings.SCORE_WINDOW, hours=1)
+        self.assertEqual(scores.rebuild(now=later), 0)
+        self.assertFalse(PostScore.objects.exists())
+
+
+class TestSuggestions(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.users = {name: User.objects.create_user(
+            username=name, email='%s@skynet.com' % name, password='12345')
+            for name in ('ana', 'ben', 'cid', 'dan', 'eva')}
+        for user, author in (('ana', 'ben'), ('ben', 'cid'),
+                             ('dan', 'ben'), ('dan', 'eva')):
+            Follow.objects.create(user=self.users[user],
+                                  author=self.users[author])
+
+    def suggested(self, name):
+        return [(s.author.username, s.score) for s in FollowSuggestion.objects
+                .filter(user=self.users[name]).order_by('-score')]
+
+    def test_scores(self):
+        self.assertEqual(suggestions.rebuild(), 3)
+        self.assertEqual(self.suggested('ana'), [('cid', 1.0), ('eva', 0.5)])
+        full = {name: self.suggested(name) for name in self.users}
+        FollowSuggestion.objects.all().delete()
+        StaleSuggestions.objects.bulk_create(
+            [StaleSuggestions(user=user) for user in self.users.values()])
+        self.assertEqual(suggestions.refresh_stale(), 5)
+        self.assertEqual({name: self.suggested(name) for name in self.users},
+                         full)
+
+    def test_adjacency(self):
+        adjacency = suggestions.Adjacency([(1, 5), (1, 7), (4, 2)])
+        self.assertEqual(list(adjacency[1]), [5, 7])
+        self.assertEqual(list(adjacency[4]), [2])
+        self.assertEqual(list(adjacency[3]), [])
+
+    @override_settings(SUGGESTION_FANOUT_LIMIT=1)
+    def test_popular_authors_skipped(self):
+        # у ben двое подписчиков - похожесть через него не считается
+        suggestions.rebuild()
+        self.assertEqual(self.suggested('ana'), [('cid', 1.0)])
+
+    def test_follow_marks_stale(self):
+        suggestions.rebuild()
+        self.assertFalse(StaleSuggestions.objects.exists())
+        ana = self.users['ana']
+        self.client.force_login(ana)
+        response = self.client.get(reverse('follow_index'))
+        self.assertEqual([author.username for author
+                          in response.context['suggestions']], ['cid', 'eva'])
+        self.assertContains(response, 'Кого почитать')
+
+        self.client.get(reverse('profile_follow', args=['cid']))
+        self.assertEqual(self.suggested('ana'), [('eva', 0.5)])
+        self.assertTrue(StaleSuggestions.objects.filter(user=ana).exists())
+        self.assertEqual(suggestions.refresh_stale(), 1)
+        self.assertFalse(StaleSuggestions.objects.exists())
+        self.assertEqual(self.suggested('ana'), [('eva', 0.5)])
+
+
+class TestTimeline(TestCase):
+    def setUp(self):
+        self.sarah = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345')
+        self.olga = User.objects.create_user(
+            username='olga', email='olga.s@skynet.com', password='54321')
+        self.rick = User.objects.create_user(
+            username='rick', email='rick.s@skynet.com', password='12345')
+
+    def texts(self, user):
+        return [post.text for post in timeline.timeline(user)]
+
+    def test_follow_backfills_and_unfollow_drops(self):
+        Post.objects.create(author=self.olga, text='Vieja')
+        Follow.objects.create(user=self.sarah, author=self.olga)
+        self.assertEqual(self.texts(self.sarah), ['Vieja'])
+        Follow.objects.filter(user=self.sarah, author=self.olga).delete()
+        self.assertEqual(self.texts(self.sarah), [])
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_new_post_fans_out(self):
+        Follow.objects.create(user=self.sarah, author=self.olga)
+        Follow.objects.create(user=self.rick, author=self.olga)
+        post = Post.objects.create(author=self.olga, text='Nueva')
+        self.assertEqual(self.texts(self.sarah), ['Nueva'])
+        self.assertEqual(self.texts(self.rick), ['Nueva'])
+        post.delete()
+        self.assertEqual(self.texts(self.sarah), [])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=2)
+    def test_popular_author_read_on_demand(self):
+        Follow.objects.create(user=self.sarah, author=self.olga)
+        Follow.objects.create(user=self.rick, author=self.olga)
+        Follow.objects.create(user=self.sarah, author=self.rick)
+        Post.objects.create(author=self.olga, text='De Olga')
+        Post.objects.create(author=self.rick, text='De Rick')
+        self.assertFalse(TimelineEntry.objects.filter(
+            post__author=self.olga).exists())
+        self.assertEqual(self.texts(self.sarah), ['De Rick', 'De Olga'])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=3, TIMELINE_FANIN_RATIO=0.5)
+    def test_author_back_below_limit_keeps_posts(self):
+        ana = User.objects.create_user(
+            username='ana', email='ana.s@skynet.com', password='12345')
+        for user in (self.sarah, self.rick, ana):
+            Follow.objects.create(user=user, author=self.olga)
+        Post.objects.create(author=self.olga, text='De Olga')
+        self.assertFalse(TimelineEntry.objects.exists())
+        Follow.objects.filter(user=ana).delete()
+        # 2 подписчика - меньше лимита, но не меньше его половины
+        self.assertFalse(timeline.fans_out(self.olga.id))
+        self.assertEqual(self.texts(self.sarah), ['De Olga'])
+        Follow.objects.filter(user=self.rick).delete()
+        self.assertTrue(timeline.fans_out(self.olga.id))
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.sarah, post__author=self.olga).exists())
+        self.assertEqual(self.texts(self.sarah), ['De Olga'])
+
+
+class TestCounters(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.sarah = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345')
+        self.olga = User.objects.create_user(
+            username='olga', email='olga.s@skynet.com', password='54321')
+        self.client.force_login(self.sarah)
+
+    def counters(self, user):
+        return counters.get_counters(User.objects.get(pk=user.pk))
+
+    def test_counters_follow_writes(self):
+        self.client.get(reverse('profile_follow',
+                        kwargs={'username': 'olga'}))
+        self.assertEqual(self.counters(self.sarah).following, 1)
+        self.assertEqual(self.counters(self.olga).followers, 1)
+        post = Post.objects.create(author=self.olga, text='Nota')
+        self.client.post(reverse('add_comment',
+                         kwargs={'username': 'olga', 'post_id': post.id}),
+                         {'text': 'Bien'})
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(self.counters(self.olga).posts, 1)
+        self.client.get(reverse('profile_unfollow',
+                        kwargs={'username': 'olga'}))
+        post.delete()
+        olga = self.counters(self.olga)
+        self.assertEqual((olga.posts, olga.followers), (0, 0))
+        self.assertEqual(self.counters(self.sarah).following, 0)
+
+    def test_migration_backfill(self):
+        for text in ('Uno', 'Dos', 'Tres'):
+            Post.objects.create(author=self.olga, text=text)
+        Follow.objects.create(user=self.sarah, author=self.olga)
+        UserCounters.objects.all().delete()
+        importlib.import_module('posts.migrations.0005_counters').fill_counters(
+            django_apps, None)
+        olga = self.counters(self.olga)
+        self.assertEqual((olga.posts, olga.followers), (3, 1))
+        self.assertEqual(self.counters(self.sarah).following, 1)
+
+    def test_save_keeps_comment_count(self):
+        post = Post.objects.create(author=self.olga, text='Nota')
+        stale = Post.objects.get(pk=post.pk)
+        Comment.objects.create(post=post, author=self.sarah, text='Bien')
+        stale.text = 'Nota editada'
+        stale.save()
+        post.refresh_from_db()
+        self.assertEqual((post.text, post.comment_count), ('Nota editada', 1))
+
+    def test_profile_reads_counters(self):
+        Follow.objects.create(user=self.olga, author=self.sarah)
+        Post.objects.create(author=self.sarah, text='Nota')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('profile',
+                                       kwargs={'username': 'sarah'}))
+        self.assertEqual(response.context['follower_cnt'], 1)
+        self.assertEqual(response.context['following_cnt'], 0)
+        self.assertEqual(response.context['count'], 1)
+        aggregates = [q['sql'] for q in queries
+                      if 'COUNT' in q['sql'] and 'posts_follow' in q['sql']]
+        self.assertEqual(aggregates, [])
+
+    def test_reconcile_fixes_drift(self):
+        post = Post.objects.create(author=self.sarah, text='Nota')
+        Post.objects.filter(pk=post.pk).update(comment_count=7)
+        UserCounters.objects.filter(user=self.olga).update(followers=3)
+        call_command('reconcile_counters', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+        self.assertEqual(self.counters(self.olga).followers, 0)
+        self.assertEqual(counters.reconcile(fix=False), 0)
+
+
+class TestSharedCache(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'cache.sqlite3')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.path, {'OPTIONS': options})
+
+    def test_shared_between_instances(self):
+        first, second = self.make_cache(), self.make_cache()
+        first.set('llave', {'valor': 1})
+        self.assertEqual(second.get('llave'), {'valor': 1})
+        second.delete('llave')
+        self.assertIsNone(first.get('llave'))
+        self.assertTrue(first.add('n', 1))
+        self.assertFalse(second.add('n', 2))
+        self.assertEqual(second.incr('n', 4), 5)
+
+    def test_expiry(self):
+        cache = self.make_cache()
+        cache.set('llave', 1, timeout=0)
+        self.assertEqual(cache.get('llave', 'nada'), 'nada')
+
+    def test_lru_eviction_and_stats(self):
+        cache = self.make_cache(MAX_ENTRIES=4, CULL_FREQUENCY=4,
+                                ACCESS_GRANULARITY=0)
+        for i in range(4):
+            cache.set('k%s' % i, i)
+        cache.get('k0')
+        cache.set('k4', 4)
+        self.assertEqual(cache.get('k0'), 0)
+        self.assertIsNone(cache.get('k1'))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']),
+                         (2, 1, 1))
+        self.assertEqual(stats['entries'], 4)
+
+    def test_totals_follow_writes(self):
+        cache = self.make_cache()
+
+        def totals():
+            return cache._totals(cache._db)
+
+        def actual():
+            return cache._db.execute(
+                'SELECT count(*), total(size) FROM cache').fetchone()
+
+        cache.set_many({'a': 1, 'b': 'x' * 100})
+        cache.set('b', 'x' * 10)
+        cache.add('c', 1)
+        cache.incr('c', 10 ** 20)
+        cache.delete('a')
+        cache.set('d', 1, timeout=0)
+        cache.get('d')
+        self.assertEqual(totals(), actual())
+        self.assertEqual(totals()[0], 2)
+        cache.clear()
+        self.assertEqual(totals(), (0, 0))
+
+    def test_totals_of_existing_file(self):
+        cache = self.make_cache()
+        cache.set_many({'a': 1, 'b': 2})
+        cache._db.execute('DROP TABLE totals')
+        self.assertEqual(self.make_cache().stats()['entries'], 2)
+
+
+class TestThumbnails(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.sarah = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345')
+        self.client.force_login(self.sarah)
+        cache.clear()
+        self.media = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.media.name)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media.cleanup()
+
+    def get_image_file(self, name='test.png'):
+        file_obj = BytesIO()
+        Image.new('RGB', size=(50, 50), color=(255, 0, 0)).save(file_obj,
+                                                                 'png')
+        file_obj.seek(0)
+        return File(file_obj, name=name)
+
+    def test_new_post_queues_job(self):
+        self.client.post(reverse('new_post'),
+                         {'text': 'Foto', 'image': self.get_image_file()})
+        post = Post.objects.get(text='Foto')
+        self.assertTrue(ThumbnailJob.objects.filter(
+            post=post, image=post.image.name).exists())
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'data:image/svg+xml')
+
+        call_command('thumbnail_worker', workers=1, once=True,
+                     stdout=StringIO())
+        self.assertFalse(ThumbnailJob.objects.exists())
+        post.refresh_from_db()
+        self.assertTrue(thumbnails.is_ready(post))
+        response = self.client.get(reverse('index'))
+        self.assertNotContains(response, 'data:image/svg+xml')
+        self.assertContains(response, thumbnails.get(post.image.name,
+                                                     'card').url)
+
+    @override_settings(THUMBNAIL_JOB_ATTEMPTS=1)
+    def test_failed_job_is_not_requeued_by_pages(self):
+        post = Post.objects.create(author=self.sarah, text='Foto',
+                                   image=self.get_image_file())
+        thumbnails.enqueue(post)
+        with mock.patch('posts.thumbnails.get', side_effect=OSError):
+            call_command('thumbnail_worker', workers=1, once=True,
+                         stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(ThumbnailJob.objects.exists())
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'data:image/svg+xml')
+        self.assertFalse(ThumbnailJob.objects.exists())
+
+    def test_claimed_job_is_not_taken_twice(self):
+        post = Post.objects.create(author=self.sarah, text='Foto',
+                                   image=self.get_image_file())
+        thumbnails.enqueue(post)
+        self.assertEqual(len(thumbnails.claim(10)), 1)
+        self.assertEqual(thumbnails.claim(10), [])
+
+    def test_backfill(self):
+        post = Post.objects.create(author=self.sarah, text='Foto',
+                                   image=self.get_image_file())
+        call_command('backfill_thumbnails', workers=1, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertTrue(thumbnails.is_ready(post))
+
+    def test_readiness_reaches_other_processes(self):
+        # у воркера и сайта разные кеши, как у отдельных процессов
+        # с LocMemCache
+        web = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'web'}})
+        worker = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'worker'}})
+        with web:
+            self.client.post(reverse('new_post'),
+                             {'text': 'Foto', 'image': self.get_image_file()})
+            response = self.client.get(reverse('index'))
+            self.assertContains(response, 'data:image/svg+xml')
+        with worker:
+            call_command('thumbnail_worker', workers=1, once=True,
+                         stdout=StringIO())
+        with web:
+            response = self.client.get(reverse('index'))
+            self.assertNotContains(response, 'data:image/svg+xml')
+            self.assertFalse(ThumbnailJob.objects.exists())
+
+    def test_new_image_is_not_ready(self):
+        post = Post.objects.create(author=self.sarah, text='Foto',
+                                   image=self.get_image_file())
+        thumbnails.enqueue(post)
+        thumbnails.run(thumbnails.claim(1)[0])
+        post.refresh_from_db()
+        post.image = self.get_image_file('other.png')
+        post.save()
+        thumbnails.enqueue(post)
+        post.refresh_from_db()
+        self.assertFalse(thumbnails.is_ready(post))
+        self.assertTrue(ThumbnailJob.objects.filter(
+            post=post, image=post.image.name).exists())
+
+
+class TestImageUploads(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.sarah = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345')
+        self.client.force_login(self.sarah)
+        self.media = tempfile.TemporaryDirectory()
+        self.settings = override_settings(MEDIA_ROOT=self.media.name,
+                                          THUMBNAIL_ASYNC=True)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        self.media.cleanup()
+
+    def upload(self, size, name='foto.jpg', fmt='jpeg', **options):
+        file_obj = BytesIO()
+        Image.new('RGB', size=size, color=(0, 128, 255)).save(
+            file_obj, fmt, **options)
+        file_obj.seek(0)
+        return self.client.post(reverse('new_post'), {
+            'text': 'Foto', 'image': File(file_obj, name=name)})
+
+    def test_large_upload_is_resized_and_stripped(self):
+        exif = Image.Exif()
+        exif[0x010f] = 'Cyberdyne'
+        self.upload((3000, 1000), exif=exif.tobytes())
+        post = Post.objects.get(text='Foto')
+        self.assertTrue(post.image.name.endswith('.webp'))
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.format, 'WEBP')
+            self.assertEqual(stored.size, (2048, 683))
+            self.assertNotIn('exif', stored.info)
+
+    def test_animation_is_resized_and_stripped(self):
+        frames = [Image.new('RGB', (3000, 100), color)
+                  for color in ((255, 0, 0), (0, 255, 0), (0, 0, 255))]
+        file_obj = BytesIO()
+        frames[0].save(file_obj, 'gif', save_all=True,
+                       append_images=frames[1:], duration=80, loop=0,
+                       comment=b'Cyberdyne')
+        file_obj.seek(0)
+        self.client.post(reverse('new_post'), {
+            'text': 'Foto', 'image': File(file_obj, name='anim.gif')})
+        post = Post.objects.get(text='Foto')
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.format, 'WEBP')
+            self.assertEqual(stored.size, (2048, 68))
+            self.assertEqual(stored.n_frames, 3)
+            self.assertNotIn('comment', stored.info)
+
+    def test_cmyk_profile_dropped(self):
+        file_obj = BytesIO()
+        Image.new('CMYK', (100, 100)).save(file_obj, 'jpeg',
+                                           icc_profile=b'cmyk profile')
+        file_obj.seek(0)
+        self.client.post(reverse('new_post'), {
+            'text': 'Foto', 'image': File(file_obj, name='cmyk.jpg')})
+        post = Post.objects.get(text='Foto')
+        with Image.open(post.image.path) as stored:
+            self.assertEqual(stored.mode, 'RGB')
+            self.assertNotIn('icc_profile', stored.info)
+
+    def test_tiny_upload_rejected(self):
+        response = self.upload((8, 8))
+        self.assertFalse(Post.objects.exists())
+        self.assertFormError(
+            response, 'form', 'image',
+            'Картинка слишком маленькая: нужно не меньше 16 точек по '
+            'каждой стороне.')
+
+    def test_truncated_upload_rejected(self):
+        file_obj = BytesIO()
+        Image.new('RGB', size=(200, 200), color=(0, 128, 255)).save(
+            file_obj, 'jpeg')
+        data = file_obj.getvalue()
+        response = self.client.post(reverse('new_post'), {
+            'text': 'Foto',
+            'image': File(BytesIO(data[:len(data) // 2]), name='foto.jpg')})
+        self.assertFalse(Post.objects.exists())
+        self.assertFormError(response, 'form', 'image',
+                             'Не удалось прочитать картинку: файл повреждён.')
+
+    def test_edit_keeps_stored_image(self):
+        self.upload((100, 100))
+        post = Post.objects.get(text='Foto')
+        name = post.image.name
+        self.client.post(reverse('post_edit', args=['sarah', post.id]),
+                         {'text': 'Editado'})
+        post.refresh_from_db()
+        self.assertEqual((post.text, post.image.name), ('Editado', name))
+
+
+class TestSearch(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.sarah = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345',
+            is_staff=True, is_superuser=True)
+        cache.clear()
+
+    def found(self, query):
+        return [post.text for post in search.search_posts(query)[:20]]
+
+    def test_ranked_and_incremental(self):
+        Post.objects.create(author=self.sarah, text='gato y perro')
+        post = Post.objects.create(author=self.sarah,
+                                   text='gato, gato y otro gato')
+        Post.objects.create(author=self.sarah, text='solo perro')
+        self.assertEqual(self.found('gato'),
+                         ['gato, gato y otro gato', 'gato y perro'])
+        self.assertEqual(self.found('perro gato'), ['gato y perro'])
+        post.text = 'ahora un raton'
+        post.save()
+        self.assertEqual(self.found('gato'), ['gato y perro'])
+        self.assertEqual(self.found('rat'), ['ahora un raton'])
+        post.delete()
+        self.assertEqual(self.found('raton'), [])
+
+    def test_operators_are_plain_words(self):
+        Post.objects.create(author=self.sarah, text='NOT OR AND')
+        self.assertEqual(self.found('NOT "OR'), ['NOT OR AND'])
+        self.assertEqual(self.found('***'), [])
+
+    def test_search_page_paginates(self):
+        for i in range(15):
+            Post.objects.create(author=self.sarah, text='Nota %s' % i)
+        response = self.client.get(reverse('search'), {'q': 'nota'})
+        self.assertEqual(response.context['paginator'].count, 15)
+        self.assertEqual(len(response.context['page']), 10)
+        self.assertContains(response, '?q=nota&amp;page=2')
+        response = self.client.get(reverse('search'),
+                                   {'q': 'nota', 'page': 2})
+        self.assertEqual(len(response.context['page']), 5)
+
+    def test_index_read_from_posts_database(self):
+        Post.objects.create(author=self.sarah, text='gato')
+        used = []
+
+        class Replica:
+            db = 'replica'
+
+            def in_bulk(self, ids):
+                return Post.objects.in_bulk(ids)
+
+        class Connections(dict):
+            def __getitem__(self, alias):
+                used.append(alias)
+                return connection
+
+        results = search.SearchResults('gato', Replica())
+        with mock.patch('posts.search.connections', Connections()):
+            self.assertEqual([post.text for post in results[:10]], ['gato'])
+        self.assertEqual(set(used), {'replica'})
+
+    def test_admin_uses_index(self):
+        Post.objects.create(author=self.sarah, text='Buscame')
+        Post.objects.create(author=self.sarah, text='Otra cosa')
+        self.client.force_login(self.sarah)
+        response = self.client.get('/admin/posts/post/', {'q': 'buscame'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+
+class TestFeedQueryPlans(TestCase):
+    def setUp(self):
+        self.sarah = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345')
+        self.olga = User.objects.create_user(
+            username='olga', email='olga.s@skynet.com', password='54321')
+        self.group = Group.objects.create(title='Grupo de prueba',
+                                          slug='prueba',
+                                          description='Mucho gusto')
+        Follow.objects.create(user=self.sarah, author=self.olga)
+
+    def assertIndexScan(self, queryset, index):
+        plan = queryset.explain()
+        self.assertNotIn('TEMP B-TREE', plan)
+        self.assertIn(index, plan)
+
+    def test_feeds_use_indexes(self):
+        feed = Post.objects.feed()
+        self.assertIndexScan(feed[:10], 'post_pub_date')
+        self.assertIndexScan(feed.order_by('-pub_date', '-id')[:10],
+                             'post_pub_date')
+        self.assertIndexScan(feed.filter(group=self.group)[:10],
+                             'post_group_pub_date')
+        self.assertIndexScan(feed.filter(author=self.sarah)[:10],
+                             'post_author_pub_date')
+        self.assertIndexScan(timeline.timeline(self.sarah)[:10],
+                             'timeline_user_pub_date')
+
+    def test_comment_pages_use_index(self):
+        post = Post.objects.create(author=self.sarah, text='Nota')
+        page = views.comment_page(post)
+        self.assertIndexScan(page.object_list, 'comment_post_created')
+
+    def test_follower_lookup_uses_index(self):
+        followers = Follow.objects.filter(author=self.olga).values('user')
+        self.assertIndexScan(followers, 'follow_author_user')
+
+
+class TestBenchmark(TestCase):
+    def test_seed_and_measure(self):
+        benchmark.seed(users=5, groups=2, posts=30, comments=20, follows=2)
+        self.assertEqual(Post.objects.count(), 30)
+        self.assertEqual(counters.reconcile(fix=False), 0)
+        results = benchmark.run(iterations=2, warmup=0,
+                                only=['index', 'follow_index'])
+        self.assertEqual(set(results['views']), {'index', 'follow_index'})
+        index = results['views']['index']
+        self.assertGreater(index['queries'], 0)
+        self.assertLessEqual(index['p50_ms'], index['p99_ms'])
+
+        slower = {'views': {
+            'index': dict(index, queries=index['queries'] + 1)}}
+        regressed = [row for row in benchmark.compare(results, slower)
+                     if row[-1]]
+        self.assertEqual([row[:2] for row in regressed],
+                         [('index', 'queries')])
+
+    def test_cache_is_private(self):
+        cache.set('site-key', 'kept')
+        benchmark.seed(users=3, groups=1, posts=5, comments=2, follows=1)
+        with benchmark.private_cache():
+            cache.set('benchmark-key', 1)
+            benchmark.run(iterations=1, warmup=0, cold=True, only=['index'])
+            self.assertIsNone(cache.get('site-key'))
+        self.assertEqual(cache.get('site-key'), 'kept')
+        self.assertIsNone(cache.get('benchmark-key'))
+
+
+@override_settings(REQUEST_STATS_SAMPLE_RATE=1)
+class TestRequestStats(TestCase):
+    def setUp(self):
+        instrumentation.flush()
+        cache.clear()
+        self.admin = User.objects.create_superuser(
+            username='sarah', email='connor.s@skynet.com', password='12345')
+        Post.objects.create(text='Hasta la vista', author=self.admin)
+
+    def test_server_timing_header(self):
+        response = Client().get(reverse('index'))
+        timing = response['Server-Timing']
+        self.assertIn('queries";dur=', timing)
+        self.assertRegex(timing, r'tpl;dur=\d')
+        self.assertIn('total;dur=', timing)
+
+    def test_cache_lookups_counted_on_any_backend(self):
+        # кеш по умолчанию - LocMemCache, своих счётчиков у него нет
+        timings = [Client().get(reverse('index'))['Server-Timing']
+                   for _ in range(2)]
+        counts = [tuple(map(int, re.search(
+            r'cache;desc="(\d+) hits, (\d+) misses"', timing).groups()))
+            for timing in timings]
+        self.assertGreater(counts[0][1], 0)
+        self.assertGreater(counts[1][0], 0)
+        stats = {row['endpoint']: row
+                 for row in instrumentation.endpoint_stats()}
+        self.assertIsNotNone(stats['index']['cache_hit_ratio'])
+
+    @override_settings(REQUEST_STATS_SAMPLE_RATE=0)
+    def test_disabled(self):
+        response = Client().get(reverse('index'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    def test_stats_page(self):
+        for _ in range(3):
+            Client().get(reverse('index'))
+        Client().get(reverse('profile', args=['sarah']))
+        stats = {row['endpoint']: row
+                 for row in instrumentation.endpoint_stats()}
+        self.assertEqual(stats['index']['requests'], 3)
+        self.assertGreater(stats['index']['queries'], 0)
+        self.assertEqual(stats['profile']['requests'], 1)
+
+        self.assertEqual(Client().get('/admin/request-stats/').status_code,
+                         302)
+        client = Client()
+        client.force_login(self.admin)
+        response = client.get('/admin/request-stats/?minutes=5')
+        self.assertContains(response, '<td>index</td>', html=False)
+
+
+class TestDatabaseProfile(TestCase):
+    def test_pragmas_applied_on_connect(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            handler = ConnectionHandler({'default': {
+                'ENGINE': 'yatube.sqlite',
+                'NAME': os.path.join(tmp, 'prod.sqlite3'),
+                'PRAGMAS': {'journal_mode': 'WAL', 'synchronous': 'NORMAL'},
+            }})
+            conn = handler['default']
+            with conn.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                self.assertEqual(cursor.fetchone()[0], 'wal')
+                cursor.execute('PRAGMA synchronous')
+                self.assertEqual(cursor.fetchone()[0], 1)
+            conn.close()
+
+    @override_settings(REPLICA_DATABASE='replica')
+    def test_router_sends_anonymous_feed_reads_to_replica(self):
+        router = db.ReplicaRouter()
+        seen = []
+
+        @db.read_from_replica
+        def view(request):
+            seen.append(router.db_for_read(Post))
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        request.user = AnonymousUser()
+        view(request)
+        request.user = User.objects.create_user(
+            username='sarah', email='connor.s@skynet.com', password='12345')
+        view(request)
+        self.assertEqual(seen, ['replica', 'default'])
+        self.assertEqual(router.db_for_read(Post), 'default')
+        with db.replica_reads():
+            self.assertEqual(router.db_for_write(Post), 'default')
+
+    def test_sync_replica(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            primary = os.path.join(tmp, 'primary.sqlite3')
+            replica = os.path.join(tmp, 'replica.sqlite3')
+            with sqlite3.connect(primary) as source:
+                source.execute('CREATE TABLE t (x)')
+                source.execute('INSERT INTO t VALUES (1)')
+            source.close()
+            sync_replica.sync(primary, replica)
+            target = sqlite3.connect(replica)
+            self.assertEqual(target.execute('SELECT x FROM t').fetchall(),
+                             [(1,)])
+            target.close()
@@ -0,0 +1,103 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Q
+from django.utils import timezone
+from sorl.thumbnail import get_thumbnail
+
+from .cache import touch
+from .models import Post, ThumbnailJob
+
+logger = logging.getLogger(__name__)
+
+
+def is_ready(post):
+    # готовность хранится в строке поста, а не в кеше: кеш у каждого
+    # процесса может быть свой, и отметка воркера не дошла бы до сайта
+    return post.thumbnails_ready is not None
+
+
+def get(name, size):
+    geometry, options = settings.POST_THUMBNAILS[size]
+    return get_thumbnail(name, geometry, **options)
+
+
+def generate(post_id, name):
+    """Make every thumbnail size and mark the post ready.
+
+    Returns the time the post was marked, or None when its image was
+    replaced meanwhile and the new one has a job of its own.
+    """
+    for size in settings.POST_THUMBNAILS:
+        get(name, size)
+    now = timezone.now()
+    # версия растёт, и карточка поста с заглушкой уступает место
+    # карточке с миниатюрой
+    marked = Post.objects.filter(pk=post_id, image=name).update(
+        thumbnails_ready=now, version=F('version') + 1, updated=now)
+    return now if marked else None
+
+
+def enqueue(post):
+    """Queue thumbnails of the post image for ``thumbnail_worker``.
+
+    The job row is written in the caller's transaction, so a rolled back
+    post leaves no job behind. With ``THUMBNAIL_ASYNC = False`` the
+    thumbnails are generated right away instead. Readiness of a replaced
+    image is reset.
+    """
+    if not post.image:
+        return
+    if post.thumbnails_ready is not None:
+        touch(Post, [post.id], thumbnails_ready=None)
+        post.thumbnails_ready = None
+    if not settings.THUMBNAIL_ASYNC:
+        post.thumbnails_ready = generate(post.id, post.image.name)
+        return
+    ThumbnailJob.objects.get_or_create(post_id=post.id,
+                                       image=post.image.name)
+
+
+def claim(limit):
+    now = timezone.now()
+    free = Q(claimed_until__isnull=True) | Q(claimed_until__lt=now)
+    claimed = []
+    for job in ThumbnailJob.objects.filter(free).order_by('id')[:limit]:
+        # задание берёт тот воркер, чей UPDATE сработал первым
+        taken = ThumbnailJob.objects.filter(free, pk=job.pk).update(
+            claimed_until=now + timedelta(
+                seconds=settings.THUMBNAIL_JOB_LEASE),
+            attempts=F('attempts') + 1)
+        if taken:
+            job.attempts += 1
+            claimed.append(job)
+    return claimed
+
+
+def run(job):
+    try:
+        generate(job.post_id, job.image)
+    except Exception:
+        logger.exception('Не удалось подготовить миниатюры %s', job.image)
+        if job.attempts < settings.THUMBNAIL_JOB_ATTEMPTS:
+            return False
+    ThumbnailJob.objects.filter(pk=job.pk).delete()
+    return True
+
+
+def run_parallel(func, jobs, workers):
+    """``map`` over a thread pool, each thread with its own DB connection."""
+    if workers <= 1:
+        return [func(job) for job in jobs]
+
+    def call(job):
+        try:
+            return func(job)
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(call, jobs))
@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Follow, Post, TimelineEntry, UserCounters
+
+
+def fans_out(author_id):
+    return not UserCounters.objects.filter(
+        user_id=author_id, read_on_demand=True).exists()
+
+
+def followers_changed(author_ids):
+    """Switch authors between fan-out on write and read on demand.
+
+    The mode is stored, not derived from the current follower count, so
+    posts published while an author was read on demand do not drop out
+    of the timelines when the count dips below the limit. An author goes
+    back to fan-out only below ``TIMELINE_FANIN_RATIO`` of the limit,
+    and then the latest ``TIMELINE_BACKFILL`` posts are fanned out.
+    """
+    limit = settings.TIMELINE_FANOUT_LIMIT
+    UserCounters.objects.filter(
+        user_id__in=author_ids, read_on_demand=False,
+        followers__gte=limit).update(read_on_demand=True)
+    back = UserCounters.objects.filter(
+        user_id__in=author_ids, read_on_demand=True,
+        followers__lt=limit * settings.TIMELINE_FANIN_RATIO)
+    for author_id in back.values_list('user_id', flat=True):
+        # раскладывает тот, чей UPDATE сработал первым
+        if not UserCounters.objects.filter(
+                user_id=author_id, read_on_demand=True).update(
+                read_on_demand=False):
+            continue
+        fan_out(Post.objects.filter(author_id=author_id).order_by(
+            '-pub_date').only('id', 'author_id', 'pub_date')[
+            :settings.TIMELINE_BACKFILL])
+
+
+def fan_out(posts):
+    by_author = {}
+    for post in posts:
+        by_author.setdefault(post.author_id, []).append(post)
+    for author_id, author_posts in by_author.items():
+        if not fans_out(author_id):
+            continue
+        followers = list(Follow.objects.filter(
+            author_id=author_id).values_list('user_id', flat=True))
+        TimelineEntry.objects.bulk_create(
+            [TimelineEntry(user_id=user_id, post_id=post.id,
+                           pub_date=post.pub_date)
+             for post in author_posts for user_id in followers],
+            ignore_conflicts=True, batch_size=500)
+
+
+def backfill(user_id, author_id):
+    if not fans_out(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date').values_list('id', 'pub_date')[
+        :settings.TIMELINE_BACKFILL]
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+         for post_id, pub_date in posts],
+        ignore_conflicts=True)
+
+
+def drop(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id,
+                                 post__author_id=author_id).delete()
+
+
+def read_fanout_authors(user):
+    """Followed authors whose posts are read on demand, not fanned out."""
+    return list(UserCounters.objects.filter(
+        user__following__user=user, read_on_demand=True).values_list(
+        'user_id', flat=True))
+
+
+def timeline(user, posts=None):
+    posts = Post.objects.feed() if posts is None else posts
+    popular = read_fanout_authors(user)
+    if popular:
+        entries = TimelineEntry.objects.filter(user=user).values('post')
+        return posts.filter(Q(id__in=entries) | Q(author__in=popular))
+    return posts.filter(timeline_entries__user=user).order_by(
+        '-timeline_entries__pub_date')
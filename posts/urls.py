@@ -6,13 +6,21 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('new/', views.new_post, name='new_post'),
     path('group/<slug:slug>/', views.group_posts, name='group_posts'),
+    path('groups/', views.group_list, name='group_list'),
+    path('trending/', views.trending, name='trending'),
+    path('discussed/', views.discussed, name='discussed'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('search/', views.search_posts, name='search'),
     path('<str:username>/', views.profile, name='profile'),
     path('<str:username>/<int:post_id>/', views.post_view, name='post'),
+    path('<str:username>/<int:post_id>/comments/',
+         views.post_comments, name='post_comments'),
     path('<str:username>/<int:post_id>/edit/',
          views.post_edit, name='post_edit'),
     path('<str:username>/<int:post_id>/comment',
          views.add_comment, name='add_comment'),
+    path('<str:username>/export/', views.profile_export,
+         name='profile_export'),
     path('<str:username>/follow/', views.profile_follow,
          name='profile_follow'),
     path('<str:username>/unfollow/', views.profile_unfollow,
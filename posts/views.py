@@ -1,25 +1,53 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from django.db import transaction
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render
 from django.shortcuts import redirect
+from django.template.loader import render_to_string
 from django.urls import reverse
-from django.views.decorators.cache import cache_page
+from django.utils.http import urlencode
 
+from yatube.db import read_from_replica
+
+from . import (comments, export, follows, groups, scores, search,
+               suggestions, thumbnails, timeline)
+from . cache import prefetch_cards
+from . counters import get_counters
 from . forms import CommentForm, PostForm
-from . models import Follow, Group, Post
+from . models import Comment, Follow, Post
+from . paginators import EstimatedCountPaginator, KeysetPaginator
 
 
 User = get_user_model()
 
+POSTS_PER_PAGE = 10
+COMMENTS_PER_PAGE = 50
+
+
+def paginate(request, posts, count=None):
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+    if settings.POSTS_PAGINATION == 'keyset' or after or before:
+        paginator = KeysetPaginator(posts, POSTS_PER_PAGE)
+        page = paginator.get_page(after=after, before=before)
+    else:
+        if settings.POSTS_PAGINATION == 'estimated':
+            # число из счётчиков - только оценка числа страниц
+            paginator = EstimatedCountPaginator(posts, POSTS_PER_PAGE, count)
+        else:
+            paginator = Paginator(posts, POSTS_PER_PAGE)
+        page = paginator.get_page(request.GET.get('page'))
+    prefetch_cards(page)
+    return paginator, page
 
-@cache_page(10)
-def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, 10)
 
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+@read_from_replica
+def index(request):
+    post_list = Post.objects.feed()
+    paginator, page = paginate(request, post_list)
     return render(
         request,
         'index.html',
@@ -28,18 +56,60 @@ def index(request):
     )
 
 
+def ranked_feed(request, posts, title):
+    # курсор по (оценка, id): страница читается по индексу оценок
+    # без COUNT(*) и OFFSET
+    paginator = KeysetPaginator(posts, POSTS_PER_PAGE, keys=scores.RANK_KEYS)
+    page = paginator.get_page(after=request.GET.get('after'),
+                              before=request.GET.get('before'))
+    prefetch_cards(page)
+    return render(request, 'ranked.html',
+                  {'page': page, 'paginator': paginator, 'title': title},
+                  content_type='text/html', status=200)
+
+
+@read_from_replica
+def trending(request):
+    return ranked_feed(request, scores.trending(), 'В тренде')
+
+
+@read_from_replica
+def discussed(request):
+    return ranked_feed(request, scores.most_discussed(), 'Обсуждаемое')
+
+
+@read_from_replica
 def group_posts(request, slug):
-    gr = get_object_or_404(Group, slug=slug)
-    post_list = Post.objects.filter(group=gr)
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    gr = groups.get_group_or_404(slug)
+    post_list = Post.objects.feed().filter(group=gr)
+    paginator, page = paginate(request, post_list)
     return render(request, 'group.html', {'group': gr,
                                           'page': page,
                                           'paginator': paginator},
                   content_type='text/html', status=200)
 
 
+@read_from_replica
+def group_list(request):
+    return render(request, 'groups.html',
+                  {'groups': groups.directory()},
+                  content_type='text/html', status=200)
+
+
+@read_from_replica
+def search_posts(request):
+    query = request.GET.get('q', '').strip()
+    paginator = Paginator(search.search_posts(query), POSTS_PER_PAGE)
+    page = paginator.get_page(request.GET.get('page'))
+    prefetch_cards(page)
+    return render(request, 'search.html',
+                  {'page': page,
+                   'paginator': paginator,
+                   'query': query,
+                   'params': urlencode({'q': query}) + '&'},
+                  content_type='text/html', status=200)
+
+
 @login_required
 def new_post(request):
     if request.method != 'POST':
@@ -50,16 +120,19 @@ def new_post(request):
         return render(request, 'newpost.html', {'form': form})
     new_item = form.save(commit=False)
     new_item.author = request.user
-    new_item.save()
+    with transaction.atomic():
+        new_item.save()
+        thumbnails.enqueue(new_item)
     return redirect(reverse('index'))
 
 
+@read_from_replica
 def profile(request, username):
-    post_user = get_object_or_404(User, username=username)
-    posts = post_user.posts.all()
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_user = get_object_or_404(User.objects.select_related('counters'),
+                                  username=username)
+    counters = get_counters(post_user)
+    posts = Post.objects.feed().filter(author=post_user)
+    paginator, page = paginate(request, posts, counters.posts)
     if request.user.is_authenticated:
         following = Follow.objects.filter(user=request.user).filter(
                     author=post_user).exists()
@@ -69,16 +142,24 @@ def profile(request, username):
                   {'page': page,
                    'paginator': paginator,
                    'author': post_user,
-                   'follower_cnt': post_user.following.count(),
-                   'following_cnt': post_user.follower.count(),
-                   'following': following},
+                   'count': counters.posts,
+                   'follower_cnt': counters.followers,
+                   'following_cnt': counters.following,
+                   'following': following,
+                   'suggestions': suggestions.for_user(
+                       request.user, exclude=post_user)},
                   content_type='text/html', status=200)
 
 
+@read_from_replica
 def post_view(request, username, post_id):
-    post = get_object_or_404(Post, pk=post_id, author__username=username)
+    post = get_object_or_404(
+        Post.objects.feed().select_related('author__counters'),
+        pk=post_id, author__username=username)
+    counters = get_counters(post.author)
+    prefetch_cards([post])
     form = CommentForm()
-    comments = post.comments.all()
+    page = comment_page(post, request.GET.get('after'))
     if request.user.is_authenticated:
         following = Follow.objects.filter(user=request.user).filter(
                     author=post.author).exists()
@@ -86,16 +167,46 @@ def post_view(request, username, post_id):
         following = True
     return render(request, 'post.html',
                   {'post': post,
-                   'count': post.author.posts.count(),
+                   'count': counters.posts,
                    'post_user': post.author,
                    'form': form,
-                   'comments': comments,
-                   'follower_cnt': post.author.following.count(),
-                   'following_cnt': post.author.follower.count(),
+                   'comments': page.object_list,
+                   'comment_page': page,
+                   'follower_cnt': counters.followers,
+                   'following_cnt': counters.following,
                    'following': following},
                   content_type='text/html', status=200)
 
 
+def comment_page(post, after=None):
+    """Newest comments first, with their authors, by keyset cursor."""
+    paginator = KeysetPaginator(
+        Comment.objects.filter(post=post).select_related('author'),
+        COMMENTS_PER_PAGE, keys=('-created', '-id'))
+    return paginator.get_forward_page(after)
+
+
+def post_comments(request, username, post_id):
+    """Next batch of comments for the "load more" button."""
+    post = get_object_or_404(Post, pk=post_id, author__username=username)
+    page = comment_page(post, request.GET.get('after'))
+    next_url = None
+    if page.has_next():
+        next_url = '%s?%s' % (
+            reverse('post_comments', args=[username, post_id]),
+            urlencode({'after': page.next_cursor}))
+    return JsonResponse({
+        'comments': [{'id': item.id,
+                      'author': item.author.username,
+                      'text': item.text,
+                      'created': item.created}
+                     for item in page],
+        'html': render_to_string('include/comment_list.html',
+                                 {'comments': page.object_list}, request),
+        'next': next_url,
+    })
+
+
 def check_author(func):
     def wrapper(request, username, post_id):
         if request.user.get_username() != username:
@@ -121,21 +232,27 @@ def post_edit(request, username, post_id):
         return render(request, 'newpost.html', {'form': form,
                                                 'post': edited_post},
                       content_type='text/html', status=200)
-    form.save()
+    with transaction.atomic():
+        form.save()
+        if 'image' in form.changed_data:
+            thumbnails.enqueue(edited_post)
     return redirect(edited_post)
 
 
 @login_required
 def add_comment(request, username, post_id):
-    post = get_object_or_404(Post, pk=post_id, author__username=username)
+    if not Post.objects.filter(pk=post_id,
+                               author__username=username).exists():
+        raise Http404
+    url = reverse('post', kwargs={'username': username, 'post_id': post_id})
     form = CommentForm(request.POST or None)
     if not form.is_valid():
-        return redirect(post)
+        return redirect(url)
     new_item = form.save(commit=False)
-    new_item.post = post
+    new_item.post_id = post_id
     new_item.author = request.user
-    new_item.save()
-    return redirect(new_item.post)
+    comments.add_comment(new_item)
+    return redirect(url)
 
 
 def page_not_found(request, exception):
@@ -148,21 +265,44 @@ def server_error(request):
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
-    return render(request, "follow.html", {'page': page,
-                                           'paginator': paginator},
+    """Posts of the followed authors, newest first.
+
+    Only the latest ``TIMELINE_BACKFILL`` posts of an author are added
+    to the timeline on follow, older ones are on the author's page.
+    """
+    posts = timeline.timeline(request.user)
+    paginator, page = paginate(request, posts)
+    return render(request, "follow.html",
+                  {'page': page,
+                   'paginator': paginator,
+                   'suggestions': suggestions.for_user(request.user)},
                   content_type='text/html', status=200)
 
 
+@login_required
+def profile_export(request, username):
+    """Stream the user's posts and comments as NDJSON or a zip."""
+    if request.user.get_username() != username and not request.user.is_staff:
+        return redirect(reverse('profile', kwargs={'username': username}))
+    author = get_object_or_404(User, username=username)
+    if request.GET.get('format') == 'zip':
+        response = StreamingHttpResponse(export.archive(author),
+                                         content_type='application/zip')
+        filename = '%s.zip' % username
+    else:
+        response = StreamingHttpResponse(
+            export.ndjson(author), content_type='application/x-ndjson')
+        filename = '%s.ndjson' % username
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response
+
+
 @login_required
 def profile_follow(request, username):
     if request.user.get_username() == username:
         return redirect(reverse('profile', kwargs={'username': username}))
     author = get_object_or_404(User, username=username)
-    Follow.objects.get_or_create(user=request.user, author=author)
+    follows.follow(request.user, [author.id])
     return redirect(reverse('profile', kwargs={'username': username}))
 
 
@@ -171,5 +311,5 @@ def profile_unfollow(request, username):
     if request.user.get_username() == username:
         return redirect(reverse('profile', kwargs={'username': username}))
     author = get_object_or_404(User, username=username)
-    Follow.objects.filter(user=request.user, author=author).delete()
+    follows.unfollow(request.user, [author.id])
     return redirect(reverse('profile', kwargs={'username': username}))
@@ -0,0 +1,272 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL,'
+    ' accessed REAL NOT NULL, size INTEGER NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE TABLE IF NOT EXISTS stats ('
+    ' name TEXT PRIMARY KEY, value INTEGER NOT NULL)',
+    # число и размер записей ведут триггеры: проверка лимитов после
+    # каждой записи читает одну строку, а не всю таблицу
+    'CREATE TABLE IF NOT EXISTS totals ('
+    ' id INTEGER PRIMARY KEY CHECK (id = 0),'
+    ' entries INTEGER NOT NULL, size INTEGER NOT NULL)',
+    'CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN'
+    ' UPDATE totals SET entries = entries + 1, size = size + NEW.size; END',
+    'CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN'
+    ' UPDATE totals SET entries = entries - 1, size = size - OLD.size; END',
+    'CREATE TRIGGER IF NOT EXISTS cache_resize AFTER UPDATE OF size ON cache'
+    ' BEGIN UPDATE totals SET size = size - OLD.size + NEW.size; END',
+)
+
+STATS = ('hits', 'misses', 'evictions')
+
+
+class SQLiteCache(BaseCache):
+    """Cache in one SQLite file shared by every process on the host.
+
+    Entries are evicted least recently used first once ``MAX_ENTRIES``
+    or ``MAX_SIZE`` (bytes of pickled values) is exceeded; both totals
+    are kept in the ``totals`` row by triggers. Hit, miss and
+    eviction counts are kept per process and added to the shared ``stats``
+    table every ``STATS_FLUSH_EVERY`` operations.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._path = location
+        self._max_size = int(options.get('MAX_SIZE', 64 * 1024 * 1024))
+        self._flush_every = int(options.get('STATS_FLUSH_EVERY', 100))
+        # чаще раза в секунду время доступа не обновляем - чтение
+        # не должно превращаться в запись
+        self._touch_after = float(options.get('ACCESS_GRANULARITY', 1))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending = dict.fromkeys(STATS, 0)
+        self._ops = 0
+        self.local_stats = dict.fromkeys(STATS, 0)
+
+    @property
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self._path, timeout=30,
+                                 isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            # INSERT OR REPLACE удаляет старую строку; без этого
+            # триггер cache_delete на ней не срабатывает
+            db.execute('PRAGMA recursive_triggers=ON')
+            with db:
+                db.execute('BEGIN IMMEDIATE')
+                for statement in SCHEMA:
+                    db.execute(statement)
+                # файл кеша, заполненный до появления totals
+                if db.execute('SELECT 1 FROM totals').fetchone() is None:
+                    db.execute('INSERT INTO totals SELECT 0, count(*), '
+                               'total(size) FROM cache')
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def _count(self, name, n=1):
+        if not n:
+            return
+        with self._lock:
+            self.local_stats[name] += n
+            self._pending[name] += n
+            self._ops += 1
+            if self._ops < self._flush_every:
+                return
+            pending, self._pending = self._pending, dict.fromkeys(STATS, 0)
+            self._ops = 0
+        self._flush_stats(pending)
+
+    def _flush_stats(self, pending):
+        rows = [(n, name) for name, n in pending.items() if n]
+        if not rows:
+            return
+        with self._db as db:
+            db.execute('BEGIN IMMEDIATE')
+            db.executemany(
+                'INSERT OR IGNORE INTO stats (name, value) VALUES (?, 0)',
+                [(name,) for _, name in rows])
+            db.executemany(
+                'UPDATE stats SET value = value + ? WHERE name = ?', rows)
+
+    def _expiry(self, timeout):
+        return self.get_backend_timeout(timeout)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _row(self, key, value, timeout, now):
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        return key, blob, self._expiry(timeout), now, len(blob)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        db = self._db
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            db.execute('DELETE FROM cache WHERE key = ? AND expires <= ?',
+                       (key, now))
+            added = db.execute(
+                'INSERT OR IGNORE INTO cache VALUES (?, ?, ?, ?, ?)',
+                self._row(key, value, timeout, now)).rowcount == 1
+        if added:
+            self._cull()
+        return added
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        return self._get_many([key]).get(key, default)
+
+    def _get_many(self, keys):
+        if not keys:
+            return {}
+        now = time.time()
+        rows = self._db.execute(
+            'SELECT key, value, expires, accessed FROM cache '
+            'WHERE key IN (%s)' % ', '.join('?' * len(keys)), keys).fetchall()
+        found, expired, stale = {}, [], []
+        for key, value, expires, accessed in rows:
+            if expires is not None and expires <= now:
+                expired.append(key)
+                continue
+            found[key] = pickle.loads(value)
+            if now - accessed > self._touch_after:
+                stale.append((now, key))
+        if expired:
+            self._delete(expired)
+        if stale:
+            self._db.executemany(
+                'UPDATE cache SET accessed = ? WHERE key = ?', stale)
+        self._count('hits', len(found))
+        self._count('misses', len(keys) - len(found))
+        return found
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        found = self._get_many(list(keys))
+        return {keys[key]: value for key, value in found.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        rows = [self._row(self._key(key, version), value, timeout, now)
+                for key, value in data.items()]
+        with self._db as db:
+            db.execute('BEGIN IMMEDIATE')
+            db.executemany(
+                'INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)', rows)
+        self._cull()
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        return self._db.execute(
+            'UPDATE cache SET expires = ?, accessed = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self._expiry(timeout), now, key, now)).rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        db = self._db
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            row = db.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)', (key, now)).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            db.execute('UPDATE cache SET value = ?, size = ?, accessed = ? '
+                       'WHERE key = ?', (blob, len(blob), now, key))
+        return value
+
+    def delete(self, key, version=None):
+        return self._delete([self._key(key, version)]) == 1
+
+    def delete_many(self, keys, version=None):
+        self._delete([self._key(key, version) for key in keys])
+
+    def _delete(self, keys):
+        if not keys:
+            return 0
+        with self._db as db:
+            return db.execute(
+                'DELETE FROM cache WHERE key IN (%s)' % ', '.join(
+                    '?' * len(keys)), keys).rowcount
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        return self._db.execute(
+            'SELECT 1 FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (key, time.time())).fetchone() is not None
+
+    def clear(self):
+        with self._db as db:
+            db.execute('DELETE FROM cache')
+
+    def _totals(self, db):
+        return db.execute('SELECT entries, size FROM totals').fetchone()
+
+    def _cull(self):
+        db = self._db
+        entries, size = self._totals(db)
+        if entries <= self._max_entries and size <= self._max_size:
+            return
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            evicted = db.execute('DELETE FROM cache WHERE expires <= ?',
+                                 (time.time(),)).rowcount
+            entries, size = self._totals(db)
+            if entries > self._max_entries or size > self._max_size:
+                # как и у встроенных бэкендов, за раз выбрасываем
+                # 1/CULL_FREQUENCY записей - самых давно прочитанных
+                excess = max(entries - self._max_entries,
+                             entries // self._cull_frequency, 1)
+                evicted += db.execute(
+                    'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                    'ORDER BY accessed LIMIT ?)', (excess,)).rowcount
+        self._count('evictions', evicted)
+
+    def stats(self):
+        """Shared hit/miss/eviction totals and the current cache size."""
+        with self._lock:
+            pending, self._pending = self._pending, dict.fromkeys(STATS, 0)
+            self._ops = 0
+        self._flush_stats(pending)
+        db = self._db
+        result = dict.fromkeys(STATS, 0)
+        result.update(db.execute('SELECT name, value FROM stats'))
+        result['entries'], result['size'] = self._totals(db)
+        result['size'] = int(result['size'])
+        result['max_entries'] = self._max_entries
+        result['max_size'] = self._max_size
+        return result
+
+    def reset_stats(self):
+        with self._db as db:
+            db.execute('DELETE FROM stats')
+        with self._lock:
+            self._pending = dict.fromkeys(STATS, 0)
+            self.local_stats = dict.fromkeys(STATS, 0)
@@ -0,0 +1,48 @@
+import contextvars
+import functools
+from contextlib import contextmanager
+
+from django.conf import settings
+
+_replica_reads = contextvars.ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def replica_reads():
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def read_from_replica(view):
+    """Send the view's reads to ``REPLICA_DATABASE``.
+
+    Only anonymous requests use the replica: signed-in users are the
+    ones who write, and they keep reading from the primary so they
+    always see their own posts and comments.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not settings.REPLICA_DATABASE or request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+        with replica_reads():
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    """Reads inside ``replica_reads()`` go to the replica, the rest and
+    all writes to the primary."""
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and settings.REPLICA_DATABASE:
+            return settings.REPLICA_DATABASE
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
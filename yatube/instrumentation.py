@@ -0,0 +1,241 @@
+import contextvars
+import random
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import DjangoTemplates, Template
+
+STATS_KEY = 'request-stats:%d'
+FIELDS = ('requests', 'queries', 'db_ms', 'template_ms', 'total_ms',
+          'cache_hits', 'cache_misses')
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class Metrics:
+    """Cost of one sampled request."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.template = 0.0
+        self.total = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.in_cache = False
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - start
+            self.queries += 1
+
+    def server_timing(self):
+        return ', '.join((
+            'db;desc="%s queries";dur=%.1f' % (self.queries, self.db * 1000),
+            'tpl;dur=%.1f' % (self.template * 1000),
+            'cache;desc="%s hits, %s misses"' % (
+                self.cache_hits, self.cache_misses),
+            'total;dur=%.1f' % (self.total * 1000),
+        ))
+
+    def values(self):
+        return (1, self.queries, self.db * 1000, self.template * 1000,
+                self.total * 1000, self.cache_hits, self.cache_misses)
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template += time.perf_counter() - start
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates that adds render time to the sampled request.
+
+    Only top-level templates are timed, so ``{% include %}`` is not
+    counted twice.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template,
+                             self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template,
+                             self)
+
+
+_MISSING = object()
+
+
+def count_lookups(backend):
+    """Count hits and misses of ``get``/``get_many`` on a cache backend.
+
+    Works with any backend: the methods of the instance are wrapped and
+    add to the sampled request, if any. Only the outermost call counts,
+    since ``get_many`` of most backends calls ``get``.
+    """
+    if getattr(backend, 'counts_lookups', False):
+        return
+    get, get_many = backend.get, backend.get_many
+
+    def counted_get(key, default=None, version=None):
+        metrics = _current.get()
+        if metrics is None or metrics.in_cache:
+            return get(key, default, version)
+        metrics.in_cache = True
+        try:
+            value = get(key, _MISSING, version)
+        finally:
+            metrics.in_cache = False
+        if value is _MISSING:
+            metrics.cache_misses += 1
+            return default
+        metrics.cache_hits += 1
+        return value
+
+    def counted_get_many(keys, version=None):
+        metrics = _current.get()
+        if metrics is None or metrics.in_cache:
+            return get_many(keys, version)
+        keys = list(keys)
+        metrics.in_cache = True
+        try:
+            found = get_many(keys, version)
+        finally:
+            metrics.in_cache = False
+        metrics.cache_hits += len(found)
+        metrics.cache_misses += len(keys) - len(found)
+        return found
+
+    backend.get, backend.get_many = counted_get, counted_get_many
+    backend.counts_lookups = True
+
+
+class RequestStatsMiddleware:
+    """Measure SQL, template and cache cost of a sample of requests.
+
+    Sampled responses get a ``Server-Timing`` header and are added to
+    per-minute, per-view totals in the default cache (see
+    ``endpoint_stats``). Disabled when ``REQUEST_STATS_SAMPLE_RATE`` is 0.
+    """
+
+    def __init__(self, get_response):
+        self.sample_rate = settings.REQUEST_STATS_SAMPLE_RATE
+        if not self.sample_rate:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+        metrics = Metrics()
+        # у каждого потока свои экземпляры бэкендов кеша
+        for alias in settings.CACHES:
+            count_lookups(caches[alias])
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        metrics.total = time.perf_counter() - start
+        response['Server-Timing'] = metrics.server_timing()
+        match = request.resolver_match
+        record(match.view_name if match else '-', metrics)
+        return response
+
+
+_lock = threading.Lock()
+_buffer = {}
+_buffered = 0
+_minute = None
+
+
+def record(endpoint, metrics):
+    """Add a request to this process's buffer, flushing it now and then.
+
+    The buffer is written out every ``REQUEST_STATS_FLUSH_EVERY``
+    requests and when the minute changes, so most sampled requests
+    cost no cache round trip.
+    """
+    global _buffered, _minute
+    minute = int(time.time() // 60)
+    with _lock:
+        row = _buffer.setdefault((minute, endpoint), [0] * len(FIELDS))
+        for i, value in enumerate(metrics.values()):
+            row[i] += value
+        _buffered += 1
+        due = (_buffered >= settings.REQUEST_STATS_FLUSH_EVERY
+               or minute != _minute)
+        _minute = minute
+    if due:
+        flush()
+
+
+def flush():
+    global _buffer, _buffered
+    with _lock:
+        buffered, _buffer, _buffered = _buffer, {}, 0
+    minutes = {}
+    for (minute, endpoint), row in buffered.items():
+        minutes.setdefault(minute, {})[endpoint] = row
+    timeout = (settings.REQUEST_STATS_WINDOW + 1) * 60
+    for minute, rows in minutes.items():
+        # get + set, а не incr по каждому полю: изредка теряется вклад
+        # параллельного процесса, зато сброс - два обращения к кешу
+        bucket = cache.get(STATS_KEY % minute) or {}
+        for endpoint, row in rows.items():
+            old = bucket.get(endpoint, [0] * len(FIELDS))
+            bucket[endpoint] = [a + b for a, b in zip(old, row)]
+        cache.set(STATS_KEY % minute, bucket, timeout)
+
+
+def endpoint_stats(minutes=None):
+    """Per-view averages over the last ``minutes``, slowest first."""
+    flush()
+    minutes = min(minutes or settings.REQUEST_STATS_WINDOW,
+                  settings.REQUEST_STATS_WINDOW)
+    now = int(time.time() // 60)
+    buckets = cache.get_many([STATS_KEY % minute
+                              for minute in range(now - minutes + 1, now + 1)])
+    totals = {}
+    for bucket in buckets.values():
+        for endpoint, row in bucket.items():
+            old = totals.get(endpoint, [0] * len(FIELDS))
+            totals[endpoint] = [a + b for a, b in zip(old, row)]
+    stats = []
+    for endpoint, row in totals.items():
+        total = dict(zip(FIELDS, row))
+        requests = total['requests']
+        lookups = total['cache_hits'] + total['cache_misses']
+        stats.append({
+            'endpoint': endpoint,
+            'requests': requests,
+            'queries': total['queries'] / requests,
+            'db_ms': total['db_ms'] / requests,
+            'template_ms': total['template_ms'] / requests,
+            'total_ms': total['total_ms'] / requests,
+            'cache_hit_ratio': (total['cache_hits'] / lookups
+                                if lookups else None),
+            'time_share': total['total_ms'],
+        })
+    stats.sort(key=lambda row: row['time_share'], reverse=True)
+    return stats
@@ -35,7 +35,7 @@ ALLOWED_HOSTS = [
 
 INSTALLED_APPS = [
     'users',
-    'posts',
+    'posts.apps.PostsConfig',
     'django.contrib.sites',
     'django.contrib.flatpages',
     'django.contrib.admin',
@@ -55,6 +55,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'yatube.instrumentation.RequestStatsMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -63,7 +64,7 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'yatube.instrumentation.TimedDjangoTemplates',
         "DIRS": [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -91,6 +92,9 @@ DATABASES = {
     }
 }
 
+# псевдоним базы-реплики для чтения лент, см. settings_prod.py
+REPLICA_DATABASE = None
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -146,8 +150,101 @@ SITE_ID = 1
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# 'offset' - обычный Paginator с номерами страниц,
+# 'estimated' - номера страниц по примерному числу постов (статистика
+# таблицы или COUNT(*), закешированный на PAGINATION_COUNT_TIMEOUT секунд),
+# 'keyset' - курсорная навигация (?after=/?before=) без COUNT(*) и OFFSET
+POSTS_PAGINATION = 'offset'
+PAGINATION_COUNT_TIMEOUT = 300
+
+# лента подписок: посты авторов, у которых меньше TIMELINE_FANOUT_LIMIT
+# подписчиков, раскладываются по лентам при публикации; посты остальных
+# читаются при запросе. Обратно к раскладке автор возвращается, когда
+# подписчиков становится меньше TIMELINE_FANOUT_LIMIT * TIMELINE_FANIN_RATIO,
+# и тогда его последние посты раскладываются по лентам всех подписчиков.
+# При подписке в ленту попадают последние TIMELINE_BACKFILL постов автора:
+# более старые посты в ленте подписок не показываются, они есть на
+# странице автора.
+TIMELINE_FANOUT_LIMIT = 1000
+TIMELINE_FANIN_RATIO = 0.8
+TIMELINE_BACKFILL = 200
+
+# загруженные картинки уменьшаются до POST_IMAGE_MAX_SIZE по большей
+# стороне и пересохраняются в POST_IMAGE_FORMAT без EXIF
+POST_IMAGE_FORMAT = 'WEBP'
+POST_IMAGE_QUALITY = 85
+POST_IMAGE_MAX_SIZE = 2048
+POST_IMAGE_MIN_SIZE = 16
+POST_IMAGE_MAX_PIXELS = 50 * 10 ** 6
+
+# миниатюры картинок постов ставятся в очередь при сохранении поста
+# и готовятся фоновым процессом (python manage.py thumbnail_worker);
+# THUMBNAIL_ASYNC = False - прямо в запросе
+POST_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+THUMBNAIL_ASYNC = True
+THUMBNAIL_JOB_LEASE = 300
+THUMBNAIL_JOB_ATTEMPTS = 3
+
+# комментарии, пришедшие одновременно, пишутся одной транзакцией:
+# первый запрос ждёт до COMMENT_BATCH_WAIT секунд остальных (не больше
+# COMMENT_BATCH_SIZE), каждый запрос отвечает после записи своего
+# комментария. Имеет смысл при воркерах с потоками (gunicorn --threads)
+COMMENT_BATCHING = False
+COMMENT_BATCH_SIZE = 50
+COMMENT_BATCH_WAIT = 0.005
+
+# ленты "В тренде" и "Обсуждаемое": вес события уменьшается вдвое за
+# *_HALF_LIFE часов. В тренде считаются публикация (с весом по числу
+# подписчиков автора) и комментарии, в обсуждаемом - только комментарии.
+# Оценки обновляются при каждом комментарии; python manage.py
+# update_scores пересчитывает их и убирает из лент посты без активности
+# за SCORE_WINDOW дней
+TRENDING_HALF_LIFE = 12
+DISCUSSED_HALF_LIFE = 48
+SCORE_WINDOW = 14
+
+# подсказки "Кого почитать": авторы, на которых подписаны ваши авторы,
+# и авторы читателей с похожими подписками (подписчики авторов, у которых
+# больше SUGGESTION_FANOUT_LIMIT подписчиков, не учитываются). Хранятся
+# по SUGGESTIONS_PER_USER на пользователя; python manage.py
+# update_suggestions пересчитывает подсказки тех, чьи подписки менялись
+# (--full - всех)
+SUGGESTIONS_PER_USER = 20
+SUGGESTION_FANOUT_LIMIT = 1000
+
+# группы по адресу кешируются до их изменения (не дольше
+# GROUP_CACHE_TIMEOUT), каталог групп /groups/ - на GROUP_DIRECTORY_TIMEOUT
+GROUP_CACHE_TIMEOUT = 3600
+GROUP_DIRECTORY_TIMEOUT = 60
+
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
     }
-}
\ No newline at end of file
+}
+
+# общий для всех процессов на хосте кеш (gunicorn с несколькими воркерами):
+# включается переменной окружения YATUBE_SHARED_CACHE=1,
+# статистика - python manage.py cache_stats
+SHARED_CACHE = {
+    'BACKEND': 'yatube.cache_backends.SQLiteCache',
+    'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+    'TIMEOUT': 300,
+    'OPTIONS': {
+        'MAX_ENTRIES': 100000,
+        'MAX_SIZE': 256 * 1024 * 1024,
+    },
+}
+
+if os.environ.get('YATUBE_SHARED_CACHE'):
+    CACHES['default'] = SHARED_CACHE
+
+# замеры стоимости запросов (число SQL-запросов, время БД и шаблонов,
+# попадания в кеш): доля замеряемых запросов, 0 - выключено. Замеры
+# отдаются в заголовке Server-Timing и копятся в кеше поминутно за
+# последние REQUEST_STATS_WINDOW минут - /admin/request-stats/
+REQUEST_STATS_SAMPLE_RATE = 0
+REQUEST_STATS_WINDOW = 60
+REQUEST_STATS_FLUSH_EVERY = 20
@@ -0,0 +1,49 @@
+"""
+Production settings: python manage.py ... --settings=yatube.settings_prod
+или DJANGO_SETTINGS_MODULE=yatube.settings_prod.
+"""
+
+from .settings import *  # noqa
+
+DEBUG = False
+
+# соединение живёт между запросами, WAL - читатели не ждут писателя
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -20000,
+    'mmap_size': 268435456,
+    'temp_store': 'MEMORY',
+}
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'yatube.sqlite',
+        'NAME': os.environ.get('YATUBE_DB',
+                               os.path.join(BASE_DIR, 'db.sqlite3')),
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {'timeout': 20},
+        'PRAGMAS': SQLITE_PRAGMAS,
+    },
+}
+
+# реплика только для чтения лент анонимными посетителями (см. yatube.db);
+# локально её заменяет копия базы, которую обновляет
+# python manage.py sync_replica --interval 5
+if os.environ.get('YATUBE_REPLICA_DB'):
+    DATABASES['replica'] = dict(
+        DATABASES['default'],
+        NAME=os.environ['YATUBE_REPLICA_DB'],
+        TEST={'MIRROR': 'default'},
+    )
+    REPLICA_DATABASE = 'replica'
+    DATABASE_ROUTERS = ['yatube.db.ReplicaRouter']
+
+# шаблоны разбираются один раз на процесс
+TEMPLATES = [dict(TEMPLATES[0], APP_DIRS=False)]
+TEMPLATES[0]['OPTIONS'] = dict(TEMPLATES[0]['OPTIONS'], loaders=[
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+])
@@ -0,0 +1,13 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """sqlite3 backend that runs the ``PRAGMAS`` of the database settings
+    on every new connection (journal mode, synchronous, cache size...).
+    """
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict.get('PRAGMAS', {}).items():
+            conn.execute('PRAGMA %s = %s' % (name, value))
+        return conn
@@ -5,11 +5,16 @@ from django.conf.urls import handler404, handler500
 from django.conf import settings
 from django.conf.urls.static import static
 
+from .views import request_stats
+
 urlpatterns = [
     path("auth/", include("users.urls")),
     path("auth/", include("django.contrib.auth.urls")),
+    path("admin/request-stats/", admin.site.admin_view(request_stats),
+         name="request_stats"),
     path("admin/", admin.site.urls),
     path('about/', include('django.contrib.flatpages.urls')),
+    path("api/v1/", include("posts.api_urls")),
     path("", include("posts.urls")),
 ]
 
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.contrib import admin
+from django.shortcuts import render
+
+from .instrumentation import endpoint_stats
+
+STATS_WINDOWS = (5, 15, 60)
+
+
+def request_stats(request):
+    """Rolling per-view request cost collected by RequestStatsMiddleware."""
+    try:
+        minutes = int(request.GET.get('minutes', 15))
+    except ValueError:
+        minutes = 15
+    minutes = max(1, min(minutes, settings.REQUEST_STATS_WINDOW))
+    context = dict(
+        admin.site.each_context(request),
+        title='Стоимость запросов',
+        stats=endpoint_stats(minutes),
+        minutes=minutes,
+        windows=[m for m in STATS_WINDOWS
+                 if m <= settings.REQUEST_STATS_WINDOW],
+        sample_rate=settings.REQUEST_STATS_SAMPLE_RATE,
+    )
+    return render(request, 'admin/request_stats.html', context)